@@ -0,0 +1,22 @@
+"""
+Benchmarks register themselves here (see 'runner.py').
+"""
+
+# name -> (generator function, parameters, number, repeat)
+BENCHMARKS = {}
+
+
+def benchmark(name, params=None, number=1, repeat=10):
+
+    # For parametrized benchmarks, the generator function takes the parameter and the name is 'name[parameter]'
+    def register(function):
+
+        if params is None:
+            BENCHMARKS[name] = (function, (), number, repeat)
+        else:
+            for param in params:
+                BENCHMARKS["{}[{}]".format(name, param)] = (function, (param, ), number, repeat)
+
+        return function
+
+    return register
@@ -0,0 +1,108 @@
+from datetime import date, timedelta
+from os import path
+from tempfile import TemporaryDirectory
+import json
+import os
+
+import numpy as np
+
+from benchmarks import benchmark
+from data_management.data_manager import DataManager
+from data_management.database import Database
+from data_management.session_writer import SessionWriter
+from data_management.trial_record import TrialRecord
+
+MONKEY = "Benchmark"
+
+TRIALS_PER_SESSION = 300
+
+
+def session_parameters():
+
+    parameters_folder = path.abspath("{}/../parameters".format(path.dirname(path.abspath(__file__))))
+    with open("{}/parameters.json".format(parameters_folder)) as file:
+        parameters = json.load(file)
+
+    parameters.pop("save", None)
+    parameters["monkey"] = MONKEY
+    return parameters
+
+
+def trials(n, seed=0):
+
+    # Trials as saved by the manager (one in ten is an error)
+    rng = np.random.RandomState(seed)
+
+    records = []
+    for i in range(n):
+
+        error = "did not take decision" if rng.random_sample() < 0.1 else None
+        records.append(TrialRecord(
+            choice=None if error else str(rng.choice(["left", "right"])), dice_output=int(rng.randint(2)),
+            error=error, gauge_level=int(rng.randint(7)), n_block=i, n_trial_inside_block=0,
+            left_beginning_angle=int(rng.randint(360)), right_beginning_angle=int(rng.randint(360)),
+            left_p=float(rng.choice([0.25, 0.5, 0.75, 1])), left_x0=int(rng.randint(-3, 4)), left_x1=0,
+            right_p=float(rng.choice([0.25, 0.5, 0.75, 1])), right_x0=int(rng.randint(-3, 4)), right_x1=0,
+            time_back_movement=500, time_fixation=250, time_fixation_actual=250.1, time_inter_block=750,
+            time_inter_block_actual=750.1, time_inter_trial=0, time_inter_trial_actual=-1, time_movement=250,
+            time_reaction=350, time_stamp_cue_contact=i * 10000 + 1000, time_stamp_cue_onset=i * 10000 + 500,
+            time_stamp_grip_onset=i * 10000, time_stamp_inter_block_interval_onset=i * 10000 + 5000,
+            time_stamp_inter_trial_interval_onset=-1000, time_stamp_release_grip=i * 10000 + 850,
+            time_stamp_result_period_onset=i * 10000 + 1500, time_stamp_reward_period_onset=i * 10000 + 3000,
+            timer_lateness_max=0.1
+        ))
+
+    return records
+
+
+@benchmark("session_writer.save_session", params=[100, 1000, 5000], repeat=10)
+def save_session(n_trials):
+
+    # From the opening of the session to the moment where its trials are in the database
+    with TemporaryDirectory() as folder:
+
+        session_writer = SessionWriter(database_path=os.path.join(folder, "benchmark.db"))
+        session_writer.start()
+
+        records = trials(n_trials)
+        parameters = session_parameters()
+
+        def save():
+            session_writer.new_session(parameters)
+            for record in records:
+                session_writer.write_trial(record)
+            session_writer.end_session()
+            session_writer.data_saved.wait()
+
+        yield save
+
+        session_writer.end()
+        session_writer.join()
+
+
+@benchmark("data_manager.run", params=[10, 100, 300], repeat=3)
+def data_manager_run(n_sessions):
+
+    # Sessions of 'TRIALS_PER_SESSION' trials, one by day
+    with TemporaryDirectory() as folder:
+
+        database_path = os.path.join(folder, "benchmark.db")
+
+        session_writer = SessionWriter(database_path=database_path)
+        session_writer.database = Database(database_path)
+
+        parameters = session_parameters()
+        first_day = date(2017, 1, 1)
+
+        for i in range(n_sessions):
+            session_writer.handle_message(("new_session", parameters, str(first_day + timedelta(days=i)), None))
+            session_writer.write_trials(trials(TRIALS_PER_SESSION, seed=i))
+            session_writer.handle_message(("end_session", ))
+
+        session_writer.database.close()
+
+        def run():
+            DataManager(monkey=MONKEY, starting_point=str(first_day), end_point=str(first_day + timedelta(n_sessions)),
+                        database_path=database_path).run()
+
+        yield run
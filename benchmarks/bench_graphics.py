@@ -0,0 +1,37 @@
+from os import path
+import os
+
+# Without display (e.g. on a server), Qt draws off screen
+if "DISPLAY" not in os.environ:
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtGui import QPixmap
+from PyQt5.QtWidgets import QApplication
+
+from benchmarks import benchmark
+from graphics.pie_chart import PieChart
+
+TEXTURES_FOLDER = path.abspath("{}/../textures".format(path.dirname(path.abspath(__file__))))
+
+
+@benchmark("pie_chart.paint", params=["480x540", "960x1080", "1920x2160"], number=10)
+def pie_chart_paint(size):
+
+    app = QApplication.instance() or QApplication([])
+
+    width, height = [int(i) for i in size.split("x")]
+
+    pie_chart = PieChart(textures_folder=TEXTURES_FOLDER, position="left")
+    pie_chart.set_parameters({"p": 0.25, "x0": 3, "x1": -2, "beginning_angle": 45})
+    pie_chart.resize(width, height)
+
+    # 'render' calls 'paintEvent' in a pixmap of the size of the widget
+    pixmap = QPixmap(pie_chart.size())
+
+    def paint():
+        pie_chart.render(pixmap)
+        app.processEvents()
+
+    yield paint
+
+    pie_chart.deleteLater()
@@ -0,0 +1,144 @@
+from multiprocessing import Value
+from threading import Thread
+from time import sleep
+
+from benchmarks import benchmark
+from raspi import protocol
+from raspi.fake_raspi import FakeServer
+from task.ressources import Client, GripManager, TtlManager, ValveManager
+from utils.channel import channel
+
+
+def connected_client(**kwargs):
+
+    # Raspberry Pi program on simulated hardware, on a free port
+    server = FakeServer(port=0, **kwargs)
+    address = server.start()
+
+    client = Client(*address)
+    assert client.establish_connection(), "Could not connect to the fake Raspberry Pi."
+
+    return server, client
+
+
+@benchmark("client.round_trip", number=1000, repeat=20)
+def client_round_trip():
+
+    server, client = connected_client()
+
+    yield lambda: client.request(protocol.GRIP_POLL, wait=True)
+
+    client.close()
+    server.close()
+
+
+@benchmark("client.synchronize", number=100)
+def client_synchronize():
+
+    # A burst of clock exchanges
+    server, client = connected_client()
+
+    yield client.synchronize
+
+    client.close()
+    server.close()
+
+
+@benchmark("client.pipelined", params=[1, 4, 16], number=10)
+def client_pipelined(n_threads):
+
+    # 160 requests shared between threads that use the same connexion
+    server, client = connected_client()
+
+    def requests():
+        for i in range(160 // n_threads):
+            client.request(protocol.GRIP_POLL, wait=True)
+
+    def run():
+        threads = [Thread(target=requests) for i in range(n_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    yield run
+
+    client.close()
+    server.close()
+
+
+@benchmark("grip_manager.event", number=1000, repeat=20)
+def grip_manager_event():
+
+    # From a change of the grip on the Raspberry Pi to the grip queue of the task
+    server, client = connected_client()
+
+    grip_queue = channel()
+    grip_manager = GripManager(grip_value=Value('i', 0), grip_queue=grip_queue, client=client)
+    grip_manager.start()
+
+    # Until the subscription has been answered
+    while grip_manager.last_event_time is None:
+        sleep(0.001)
+
+    state = [1]
+
+    def change():
+        server.set_grip(state[0])
+        grip_queue.get()
+        state[0] = 1 - state[0]
+
+    yield change
+
+    grip_manager.end()
+    grip_manager.join()
+    server.close()
+
+
+@benchmark("valve_manager.burst", number=5)
+def valve_manager_burst():
+
+    # 50 orders of 0 ms, until the valve has been closed for the last one
+    server, client = connected_client()
+
+    valve_manager = ValveManager(client=client)
+    valve_manager.start()
+
+    n_orders = [0]
+
+    def burst():
+        for i in range(50):
+            valve_manager.open(0)
+        n_orders[0] += 50
+        assert server.serial_port.wait_for_writes(2 * n_orders[0], timeout=10)
+
+    yield burst
+
+    valve_manager.end()
+    valve_manager.join()
+    server.close()
+
+
+@benchmark("ttl_manager.burst", number=5)
+def ttl_manager_burst():
+
+    # 50 signals of 0.1 ms, until the last one has been sent
+    server, client = connected_client(ttl_pulse_time=0.0001)
+
+    ttl_manager = TtlManager(client=client)
+    ttl_manager.start()
+
+    pin = server.ttl_signal.gpio_out
+    n_signals = [0]
+
+    def burst():
+        for i in range(50):
+            ttl_manager.send_signal()
+        n_signals[0] += 50
+        assert server.gpio.wait_for_outputs(pin, 1, n_signals[0], timeout=10)
+
+    yield burst
+
+    ttl_manager.end()
+    ttl_manager.join()
+    server.close()
@@ -0,0 +1,67 @@
+from multiprocessing import Value
+from tempfile import TemporaryDirectory
+from threading import Event
+import os
+
+from benchmarks import benchmark
+from task.experimentalist import Manager
+from task.ressources import Scheduler, Timer
+from task.simulation import VirtualScheduler
+from task.stimuli_finder import StimuliFinder
+from utils.channel import channel
+
+
+@benchmark("stimuli_finder.find", number=20000, repeat=20)
+def stimuli_finder_find():
+
+    stimuli_finder = StimuliFinder()
+    stimuli_finder.set_parameters(control_trials_proportion=50, with_losses_proportion=50, incongruent_proportion=50)
+
+    yield stimuli_finder.find
+
+
+@benchmark("stimuli_finder.generate", params=[100, 1000, 10000], repeat=10)
+def stimuli_finder_generate(n):
+
+    stimuli_finder = StimuliFinder()
+    stimuli_finder.set_parameters(control_trials_proportion=50, with_losses_proportion=50, incongruent_proportion=50)
+
+    yield lambda: stimuli_finder.generate(n)
+
+
+@benchmark("manager.receive", number=10000, repeat=20)
+def manager_receive():
+
+    # Dispatch only: a choice outside of the decision is ignored, a 'close' of the interface has no handler
+    queues = {"manager": channel(), "interface": channel(), "grip_queue": channel(), "grip_value": Value('i', 0)}
+
+    with TemporaryDirectory() as folder:
+
+        manager = Manager(communicant=None, queues=queues, shutdown=Event(), scheduler=VirtualScheduler(),
+                          database_path=os.path.join(folder, "benchmark.db"))
+
+        def receive():
+            manager.receive(("game", "choice", "left"))
+            manager.receive(("interface", "close"))
+
+        yield receive
+
+        manager.die()
+
+
+@benchmark("timer.launch_cancel", number=10000, repeat=20)
+def timer_launch_cancel():
+
+    scheduler = Scheduler(grip_queue=channel())
+    scheduler.start()
+
+    timer = Timer(scheduler=scheduler, message_queue=channel())
+
+    def launch_cancel():
+        timer.launch("benchmark", 0.01)
+        timer.cancel()
+
+    yield launch_cancel
+
+    scheduler.end()
+    scheduler.join()
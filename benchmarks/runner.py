@@ -0,0 +1,179 @@
+from contextlib import redirect_stdout
+from importlib import import_module
+from os import path
+from time import perf_counter
+import argparse
+import json
+import os
+import platform
+import sys
+
+import numpy as np
+
+from benchmarks import BENCHMARKS
+
+"""
+Benchmarks of the hot paths of the task, of the saving and of the import of the data.
+
+A benchmark is a generator registered with 'benchmark': it prepares what is needed, yields the function to time,
+then cleans up. Every benchmark is run 'repeat' times 'number' calls; the median time of a call is compared with
+the baseline stored in 'baselines.json'. With the baseline is stored its noise (interquartile range of the
+repetitions, relative to the median): a benchmark has regressed when it is slower than 'tolerance' times its
+baseline, widened by this noise. Run (from the root of the project):
+
+    $ python -m benchmarks.runner                 # Compare with the baselines
+    $ python -m benchmarks.runner --save          # Store the results as new baselines
+    $ python -m benchmarks.runner -k stimuli      # Only benchmarks whose name contains 'stimuli'
+
+Baselines depend on the computer: they should be saved again on the computer used for the recordings.
+"""
+
+# Modules of benchmarks (those whose dependencies are not installed are skipped)
+MODULES = ["benchmarks.bench_task", "benchmarks.bench_data", "benchmarks.bench_graphics", "benchmarks.bench_raspi"]
+
+BASELINES = path.join(path.dirname(path.abspath(__file__)), "baselines.json")
+
+
+def measure(function, args, number, repeat):
+
+    # Return the times of a call (in seconds), one by repetition
+    generator = function(*args)
+    call = next(generator)
+
+    times = []
+    try:
+        call()  # Warm up
+        for i in range(repeat):
+            start = perf_counter()
+            for j in range(number):
+                call()
+            times.append((perf_counter() - start) / number)
+
+    finally:
+        next(generator, None)
+
+    return times
+
+
+def load_modules():
+
+    skipped = []
+    for module in MODULES:
+        try:
+            import_module(module)
+        except ImportError as e:
+            skipped.append((module, str(e)))
+
+    return skipped
+
+
+def load_baselines():
+
+    if not path.exists(BASELINES):
+        return {}
+
+    with open(BASELINES) as file:
+        baselines = json.load(file)["results"]
+
+    # Baselines saved without their noise
+    return {name: baseline if isinstance(baseline, dict) else {"median": baseline, "noise": 0.}
+            for name, baseline in baselines.items()}
+
+
+def save_baselines(results):
+
+    content = {
+        "machine": {"node": platform.node(), "processor": platform.processor(), "python": platform.python_version()},
+        "results": results
+    }
+
+    with open(BASELINES, "w") as file:
+        json.dump(content, file, indent=4, sort_keys=True)
+
+
+def summarize(times):
+
+    median = float(np.median(times))
+    noise = float(np.percentile(times, 75) - np.percentile(times, 25)) / median
+
+    return {"median": median, "noise": noise}
+
+
+def format_time(seconds):
+
+    for unit, factor in (("s", 1), ("ms", 1e3), ("us", 1e6)):
+        if seconds >= 1 / factor:
+            return "{:.3g} {}".format(seconds * factor, unit)
+
+    return "{:.3g} ns".format(seconds * 1e9)
+
+
+def run(keyword=None, tolerance=1.5, verbose=False):
+
+    # Return the results (name -> median time of a call and noise) and the names of the benchmarks that have
+    # regressed
+    baselines = load_baselines()
+    results, regressions = {}, []
+
+    for name, (function, args, number, repeat) in BENCHMARKS.items():
+
+        if keyword is not None and keyword not in name:
+            continue
+
+        if verbose:
+            times = measure(function, args, number, repeat)
+        else:
+            # Logs of the program are not part of the output
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                times = measure(function, args, number, repeat)
+
+        results[name] = summarize(times)
+
+        line = "{:<45} min {:>10}  median {:>10}  noise {:>4.0%}".format(
+            name, format_time(min(times)), format_time(results[name]["median"]), results[name]["noise"])
+
+        if name in baselines:
+            ratio = results[name]["median"] / baselines[name]["median"]
+            limit = tolerance * (1 + baselines[name]["noise"])
+            line += "  x{:.2f} of baseline (limit x{:.2f})".format(ratio, limit)
+            if ratio > limit:
+                regressions.append(name)
+                line += "  REGRESSION"
+
+        print(line)
+
+    return results, regressions
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Run the benchmarks and compare them with the baselines.")
+    parser.add_argument("-k", dest="keyword", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--save", action="store_true", help="Store the results as new baselines")
+    parser.add_argument("--tolerance", type=float, default=1.5,
+                        help="Slow down (ratio to the baseline, widened by its noise) above which a benchmark "
+                             "has regressed")
+    parser.add_argument("--verbose", action="store_true", help="Show the logs of the program")
+    args = parser.parse_args()
+
+    for module, reason in load_modules():
+        print("Skip '{}': {}.".format(module, reason))
+
+    results, regressions = run(keyword=args.keyword, tolerance=args.tolerance, verbose=args.verbose)
+
+    if args.save:
+        # Baselines of the benchmarks that have not been run are kept
+        baselines = load_baselines()
+        baselines.update(results)
+        save_baselines(baselines)
+        print("Baselines saved in '{}'.".format(BASELINES))
+
+    elif regressions:
+        print("{} benchmark(s) slower than {} times their baseline (and noise): {}.".format(
+            len(regressions), args.tolerance, ", ".join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,225 @@
+import json
+import os
+import numpy as np
+
+from data_management.long_format import LongFormat
+from utils.utils import log
+
+
+class TrialsCache(object):
+
+    # Columnar copy on disk (one '.npy' file per column, memory-mapped when loaded) of every trial of a monkey.
+    # The cache is keyed by the state of the database files: if they did not change, nothing is read from the
+    # database; otherwise only the sessions that are not in the cache yet, or whose number of trials has changed
+    # (session being recorded, journal replayed), are imported again.
+
+    name = "TrialsCache"
+
+    version = 2
+
+    columns = ["error", "choice", "left_p", "left_x0", "left_x1", "right_p", "right_x0", "right_x1"]
+    dtypes = {"error": str, "choice": str, "left_p": float, "right_p": float}
+
+    def __init__(self, database, monkey, long_format=False, cache_folder=None):
+
+        self.db = database
+        self.monkey = monkey
+        self.long_format = long_format
+
+        if cache_folder is None:
+            cache_folder = os.path.join(os.path.dirname(os.path.abspath(self.db.db_path)), "cache")
+
+        self.folder = os.path.join(cache_folder, "{}_{}".format(
+            self.monkey, "long_format" if self.long_format else "session_tables"))
+
+    # ------------------------------------- KEY --------------------------------------------------------------- #
+
+    def database_state(self):
+
+        # With WAL journaling, recent writes are in the '-wal' file, not in the database file itself
+        state = []
+        for suffix in ("", "-wal"):
+            try:
+                stat = os.stat(self.db.db_path + suffix)
+                state.append([stat.st_mtime_ns, stat.st_size])
+            except FileNotFoundError:
+                state.append(None)
+
+        return state
+
+    def read_meta(self):
+
+        try:
+            with open(os.path.join(self.folder, "meta.json")) as file:
+                meta = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if meta.get("version") != self.version:
+            return None
+
+        return meta
+
+    def write_meta(self, meta):
+
+        tmp = os.path.join(self.folder, "meta.json.tmp")
+        with open(tmp, "w") as file:
+            json.dump(meta, file)
+        os.replace(tmp, os.path.join(self.folder, "meta.json"))
+
+    # ------------------------------------- DATABASE ---------------------------------------------------------- #
+
+    def sessions(self):
+
+        # (session id, date, table containing the trials, number of trials) for every session of the monkey,
+        # in order of saving
+        self.db.open()
+
+        if self.long_format:
+            # noinspection SqlResolve
+            rows = self.db.cursor.execute(
+                "SELECT s.ID, s.date, COUNT(t.ID) FROM `{}` s LEFT JOIN `{}` t ON t.session_id = s.ID "
+                "WHERE s.monkey = ? GROUP BY s.ID ORDER BY s.ID".format(
+                    LongFormat.sessions_table, LongFormat.trials_table), (self.monkey, )).fetchall()
+            return [(i, date, None, n) for i, date, n in rows]
+
+        else:
+            # noinspection SqlResolve
+            rows = self.db.cursor.execute(
+                "SELECT ID, date, session_table FROM summary WHERE monkey = ? ORDER BY ID", (self.monkey, )).fetchall()
+            return [(i, date, session_table, self.count_trials(session_table)) for i, date, session_table in rows]
+
+    def count_trials(self, session_table):
+
+        # A session table is created with its first trials: it may not exist yet
+        if not self.db.table_exists(session_table):
+            return 0
+
+        # noinspection SqlResolve
+        return self.db.cursor.execute("SELECT COUNT(*) FROM `{}`".format(session_table)).fetchone()[0]
+
+    def read_session(self, session_id, session_table):
+
+        self.db.open()
+
+        if self.long_format:
+            # noinspection SqlResolve
+            return self.db.cursor.execute(
+                "SELECT {} FROM `{}` WHERE session_id = ? ORDER BY ID".format(
+                    ", ".join(self.columns), LongFormat.trials_table), (session_id, )).fetchall()
+
+        else:
+            return self.db.cursor.execute(
+                "SELECT {} FROM `{}` ORDER BY ID".format(", ".join(self.columns), session_table)).fetchall()
+
+    def import_sessions(self, sessions):
+
+        rows, session_id, date = [], [], []
+
+        for i, d, session_table, n_trials in sessions:
+
+            session_rows = self.read_session(i, session_table)
+
+            rows += session_rows
+            session_id += [i, ] * len(session_rows)
+            date += [d, ] * len(session_rows)
+
+        data = np.array(rows, dtype=object).reshape(-1, len(self.columns))
+
+        arrays = {
+            "session_id": np.asarray(session_id, dtype=int),
+            "date": np.asarray(date, dtype=str).astype("U10")
+        }
+
+        for idx, column in enumerate(self.columns):
+            arrays[column] = data[:, idx].astype(self.dtypes.get(column, int))
+
+        return arrays
+
+    # ------------------------------------- FILES ------------------------------------------------------------- #
+
+    def load_arrays(self, mmap_mode="r"):
+
+        return {column: np.load(os.path.join(self.folder, "{}.npy".format(column)), mmap_mode=mmap_mode)
+                for column in ["session_id", "date"] + self.columns}
+
+    def save_arrays(self, arrays):
+
+        os.makedirs(self.folder, exist_ok=True)
+
+        for column, array in arrays.items():
+            tmp = os.path.join(self.folder, "{}.tmp.npy".format(column))
+            np.save(tmp, array)
+            os.replace(tmp, os.path.join(self.folder, "{}.npy".format(column)))
+
+    # ------------------------------------- UPDATE ------------------------------------------------------------ #
+
+    def update(self):
+
+        state = self.database_state()
+        meta = self.read_meta()
+
+        if meta is not None and meta["database_state"] == state:
+            return
+
+        sessions = self.sessions()
+
+        # Session id (as a string, as in JSON) -> number of trials
+        n_trials = {str(i[0]): i[3] for i in sessions}
+
+        if meta is not None and set(meta["n_trials"]).issubset(n_trials):
+
+            changed = [i for i in sessions if meta["n_trials"].get(str(i[0])) != i[3]]
+            log("{} new or modified session(s) to import in the cache.".format(len(changed)), self.name)
+
+            if changed:
+                old = self.load_arrays(mmap_mode=None)
+                new = self.import_sessions(changed)
+
+                # Trials of a modified session are replaced by all of its trials
+                kept = ~np.isin(old["session_id"], [i[0] for i in changed])
+
+                # 'np.concatenate' widens string dtypes when new values are longer
+                arrays = {column: np.concatenate([old[column][kept], new[column]]) for column in old}
+
+                # Sessions stay in order of saving
+                order = np.argsort(arrays["session_id"], kind="stable")
+                self.save_arrays({column: array[order] for column, array in arrays.items()})
+
+        else:
+            log("Build cache from {} session(s).".format(len(sessions)), self.name)
+            self.save_arrays(self.import_sessions(sessions))
+
+        self.write_meta({"version": self.version, "database_state": state, "n_trials": n_trials})
+
+    def get(self, starting_point, end_point):
+
+        # Return the trials of the last session of every day between the two dates (ISO format),
+        # in the same form as DataManager.get_errors_p_x0_x1_choices_from_db
+
+        self.update()
+        arrays = self.load_arrays()
+
+        date = arrays["date"]
+        session_id = arrays["session_id"]
+
+        in_range = (date >= starting_point) * (date <= end_point)
+
+        # Last session of every day ('np.unique' on reversed arrays gives the last occurrence of each date)
+        reversed_idx = np.unique(date[::-1], return_index=True)[1]
+        last_sessions = session_id[::-1][reversed_idx]
+        selected = np.where(in_range * np.isin(session_id, last_sessions))[0]
+
+        # Sessions ordered by date (they are stored in order of saving)
+        selected = selected[np.argsort(date[selected], kind="stable")]
+
+        date = np.asarray(date[selected])
+        session = np.unique(date, return_inverse=True)[1]
+
+        p, x0, x1 = {}, {}, {}
+        for side in ["left", "right"]:
+            p[side] = arrays["{}_p".format(side)][selected]
+            x0[side] = arrays["{}_x0".format(side)][selected]
+            x1[side] = arrays["{}_x1".format(side)][selected]
+
+        return arrays["error"][selected], p, x0, x1, arrays["choice"][selected], session, date
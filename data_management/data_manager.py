@@ -1,6 +1,10 @@
+from datetime import date as dt_date
+from sqlite3 import OperationalError
 import numpy as np
 
+from data_management.cache import TrialsCache
 from data_management.database import Database
+from data_management.long_format import LongFormat
 from utils.utils import log, today
 
 
@@ -8,161 +12,261 @@ class DataManager(object):
 
     name = "DataManager"
 
-    def __init__(self, monkey, starting_point="2016-12-01", end_point=today(), database_path=None):
+    columns = ["error", "choice", "left_p", "left_x0", "left_x1", "right_p", "right_x0", "right_x1"]
+
+    def __init__(self, monkey, starting_point="2016-12-01", end_point=today(), database_path=None,
+                 long_format=None, use_cache=False):
 
         self.db = Database(database_path)
         self.monkey = monkey
         self.starting_point = starting_point
         self.end_point = end_point
 
-    def select_relevant_dates(self, dates_list):
+        # Read from the normalized 'sessions' / 'trials' tables (by default, as set in 'results_path.json')
+        self.long_format = self.db.long_format if long_format is None else long_format
 
-        log("Starting point: {}.".format(self.starting_point), self.name)
-        log("End point: {}.".format(self.end_point), self.name)
+        # Load trials from a columnar copy on disk, updated only with the sessions saved since last import
+        self.use_cache = use_cache
+
+    @staticmethod
+    def iso_date(str_date):
+
+        # '2016-8-1' -> '2016-08-01', so that dates can be compared as strings (and by SQLite)
+        return str(dt_date(*[int(i) for i in str_date.split("-")]))
+
+    @staticmethod
+    def ordinal(str_date):
 
-        starting_point = [int(i) for i in self.starting_point.split("-")]
-        end_point = [int(i) for i in self.end_point.split("-")]
+        return dt_date(*[int(i) for i in str_date.split("-")]).toordinal()
 
-        relevant_dates = []
-        for str_date in dates_list:
+    def select_relevant_dates(self, dates_list):
 
-            date = [int(i) for i in str_date.split("-")]
+        # Python counterpart of the selection made in SQL by 'get_dates', for dates that can not be compared
+        # as strings (not in ISO format, e.g. '2016-8-1'): comparisons are made on ordinals, in one NumPy pass
+        dates = np.asarray(dates_list)
+        ordinals = np.array([self.ordinal(i) for i in dates_list], dtype=int)
 
-            # If year of date is between the years of starting point and end point (but not equal to them)
-            if starting_point[0] < date[0] < end_point[0]:
-                relevant_dates.append(str_date)
+        relevant = (ordinals >= self.ordinal(self.starting_point)) * (ordinals <= self.ordinal(self.end_point))
+        order = np.argsort(ordinals[relevant], kind="stable")
 
-            elif starting_point[0] > date[0] or date[0] > end_point[0]:
-                continue
+        return dates[relevant][order].tolist()
 
-            # If year of date is equal to the years of starting point and end point (which are equal)
-            elif date[0] == starting_point[0] == end_point[0]:
+    def get_dates(self):
 
-                if starting_point[1] > date[1] or date[1] > end_point[1]:
-                    continue
+        assert self.db.table_exists("summary")
 
-                elif (end_point[1] > date[1] > starting_point[1]) \
-                        or (date[1] == starting_point[1] == end_point[1]
-                            and starting_point[2] <= date[2] <= end_point[2]) \
-                        or (date[1] == starting_point[1]
-                            and date[2] >= starting_point[2]) \
-                        or (date[1] == end_point[1]
-                            and date[2] <= end_point[2]):
-                    relevant_dates.append(str_date)
+        log("Starting point: {}.".format(self.starting_point), self.name)
+        log("End point: {}.".format(self.end_point), self.name)
 
-            # If year of date is equal to the year of starting point (and is inferior to the year of end point)
-            elif date[0] == starting_point[0]:
+        try:
+            self.db.create_index("summary", ["monkey", "date"])
+        except OperationalError as e:
+            log("Could not create index on summary table: {}.".format(e), self.name)
 
-                if (date[1] > starting_point[1])\
-                        or (date[1] == starting_point[1]
-                            and date[2] >= starting_point[2]):
-                    relevant_dates.append(str_date)
+        self.db.open()
 
-            # If year of date is equal to the year of starting point (and is superior to the year of starting point)
-            elif date[0] == end_point[0]:
+        try:
+            # noinspection SqlResolve
+            n_not_iso = self.db.cursor.execute(
+                "SELECT COUNT(*) FROM summary WHERE monkey = ? AND date NOT GLOB ?",
+                (self.monkey, "[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]")).fetchone()[0]
 
-                if (date[1] < end_point[1]) \
-                        or (date[1] == end_point[1]
-                            and date[2] <= end_point[2]):
-                    relevant_dates.append(str_date)
+            if n_not_iso:
+                raise ValueError("{} date(s) not in ISO format".format(n_not_iso))
 
-        return relevant_dates
+            # noinspection SqlResolve
+            query = "SELECT DISTINCT date FROM summary WHERE monkey = ? AND date BETWEEN ? AND ? ORDER BY date"
+            dates = [i[0] for i in self.db.cursor.execute(
+                query, (self.monkey, self.iso_date(self.starting_point), self.iso_date(self.end_point))).fetchall()]
 
-    def get_dates(self):
+        except (OperationalError, ValueError) as e:
 
-        assert self.db.table_exists("summary")
-        all_dates = np.unique(self.db.read_column(table_name="summary", column_name='date', monkey=self.monkey))
-        assert len(all_dates)
-        dates = self.select_relevant_dates(all_dates)
+            log("Dates selected in Python ({}).".format(e), self.name)
+
+            # noinspection SqlResolve
+            dates = self.select_relevant_dates([i[0] for i in self.db.cursor.execute(
+                "SELECT DISTINCT date FROM summary WHERE monkey = ?", (self.monkey, )).fetchall()])
 
         log("N dates: {}.".format(len(dates)), self.name)
         log("Relevant dates: {}".format(dates), self.name)
 
         return dates
 
+    def to_arrays(self, rows, session, date):
+
+        # Rows (tuples ordered as 'self.columns') -> one array per column
+        data = np.array(rows, dtype=object).reshape(-1, len(self.columns))
+        column = {name: data[:, i] for i, name in enumerate(self.columns)}
+
+        error = column["error"]
+        choice = column["choice"]
+
+        p, x0, x1 = {}, {}, {}
+        for side in ["left", "right"]:
+            p[side] = column["{}_p".format(side)].astype(float)
+            x0[side] = column["{}_x0".format(side)].astype(int)
+            x1[side] = column["{}_x1".format(side)].astype(int)
+
+        return error, p, x0, x1, choice, np.asarray(session, dtype=int), np.asarray(date)
+
+    def get_session_table(self, date):
+
+        session_table = \
+            self.db.read_column(table_name="summary", column_name='session_table',
+                                monkey=self.monkey, date=date)
+
+        # Only the last session of the day is used
+        if type(session_table) == list:
+            session_table = session_table[-1]
+
+        return session_table
+
     def get_errors_p_x0_x1_choices_from_db(self, dates):
 
-        p = {"left": [], "right": []}
-        x0 = {"left": [], "right": []}
-        x1 = {"left": [], "right": []}
-        error = []
-        choice = []
+        rows = []
         session = []
         date_list = []
 
-        for idx, date in enumerate(sorted(dates)):
+        query = "SELECT {} FROM `{{}}`".format(", ".join(self.columns))
 
-            session_table = \
-                self.db.read_column(table_name="summary", column_name='session_table',
-                                    monkey=self.monkey, date=date)
+        for idx, date in enumerate(sorted(dates, key=self.ordinal)):
 
-            if type(session_table) == list:
-                session_table = session_table[-1]
+            session_table = self.get_session_table(date)
 
-            error_session = self.db.read_column(table_name=session_table, column_name="error")
-            choice_session = self.db.read_column(table_name=session_table, column_name="choice")
+            # All the columns of a session in a single query
+            session_rows = self.db.read(query.format(session_table))
 
-            error += error_session
-            choice += choice_session
+            rows += session_rows
+            session += [idx, ] * len(session_rows)
+            date_list += [date, ] * len(session_rows)
 
-            session += [idx, ] * len(error_session)
-            date_list += [date, ] * len(error_session)
+        return self.to_arrays(rows, session, date_list)
 
-            for side in ["left", "right"]:
+    def get_errors_p_x0_x1_choices_from_long_format(self):
 
-                p[side] += \
-                    [float(i) for i in self.db.read_column(table_name=session_table, column_name='{}_p'.format(side))]
-                x0[side] += \
-                    [int(i) for i in self.db.read_column(table_name=session_table, column_name='{}_x0'.format(side))]
-                x1[side] += \
-                    [int(i) for i in self.db.read_column(table_name=session_table, column_name='{}_x1'.format(side))]
+        # All the trials of all the relevant sessions in a single query (last session of each day, as above)
+        rows = LongFormat(self.db).read_trials(
+            monkey=self.monkey, columns=["s.date"] + self.columns,
+            starting_point=self.iso_date(self.starting_point), end_point=self.iso_date(self.end_point),
+            last_session_per_date=True)
+
+        date = np.array([i[0] for i in rows], dtype=object)
+        dates, session = np.unique(date.astype(str), return_inverse=True)
+
+        log("N dates: {}.".format(len(dates)), self.name)
+        log("Relevant dates: {}".format(list(dates)), self.name)
 
-        return error, p, x0, x1, choice, session, date_list
+        return self.to_arrays([i[1:] for i in rows], session, date.astype(str))
 
     def filter_valid_trials(self, error, p, x0, x1, choice, session, date):
 
-        new_p = {"left": [], "right": []}
-        new_x0 = {"left": [], "right": []}
-        new_x1 = {"left": [], "right": []}
-        new_choice = []
-        new_session = []
-        new_date = []
+        # Errors are stored as NULL (or as the string 'None' for sessions saved with older versions)
+        valid = np.asarray(error).astype(str) == "None"
+        log("N valid trials: {}.".format(np.sum(valid)), self.name)
 
-        valid_trials = np.where(np.asarray(error) == "None")[0]
-        log("N valid trials: {}.".format(len(valid_trials)), self.name)
+        new_p = {side: p[side][valid] for side in ["left", "right"]}
+        new_x0 = {side: x0[side][valid] for side in ["left", "right"]}
+        new_x1 = {side: x1[side][valid] for side in ["left", "right"]}
 
-        for valid_idx in valid_trials:
+        return new_p, new_x0, new_x1, choice[valid], session[valid], date[valid]
 
-            new_date.append(date[valid_idx])
-            new_session.append(session[valid_idx])
-            new_choice.append(choice[valid_idx])
+    def make_chunk(self, rows, session, date, valid_only):
 
-            for side in ["left", "right"]:
+        error, p, x0, x1, choice, session, date = self.to_arrays(rows, session, date)
+        chunk = {"p": p, "x0": x0, "x1": x1, "choice": choice, "session": session, "date": date}
 
-                new_p[side].append(p[side][valid_idx])
-                new_x0[side].append(x0[side][valid_idx])
-                new_x1[side].append(x1[side][valid_idx])
+        if valid_only:
+            valid = error.astype(str) == "None"
+            for key in ["p", "x0", "x1"]:
+                chunk[key] = {side: chunk[key][side][valid] for side in ["left", "right"]}
+            for key in ["choice", "session", "date"]:
+                chunk[key] = chunk[key][valid]
 
-        for side in ["left", "right"]:
-            new_p[side] = np.asarray(new_p[side])
-            new_x0[side] = np.asarray(new_x0[side])
-            new_x1[side] = np.asarray(new_x1[side])
+        else:
+            chunk["error"] = error
+
+        return chunk
+
+    def iter_trials(self, chunk_size=1000, valid_only=True):
+
+        # Same content as 'run', but yielded by chunks of at most 'chunk_size' trials: rows are fetched
+        # progressively from the database, so that memory does not grow with the number of sessions.
+
+        self.db.open()
+        cursor = self.db.connexion.cursor()
+
+        if self.long_format:
+
+            query, args = LongFormat(self.db).trials_query(
+                monkey=self.monkey, columns=["s.date"] + self.columns,
+                starting_point=self.iso_date(self.starting_point), end_point=self.iso_date(self.end_point),
+                last_session_per_date=True)
+            cursor.execute(query, args)
+
+            # Rows are ordered by date: session index is increased every time the date changes
+            idx, last_date = -1, None
+
+            while True:
+
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+
+                date = np.array([i[0] for i in rows], dtype=str)
+                new_session = np.concatenate([[date[0] != last_date], date[1:] != date[:-1]])
+                session = idx + np.cumsum(new_session)
+                idx, last_date = session[-1], date[-1]
+
+                chunk = self.make_chunk([i[1:] for i in rows], session, date, valid_only)
+                if len(chunk["date"]):
+                    yield chunk
+
+        else:
+
+            query = "SELECT {} FROM `{{}}`".format(", ".join(self.columns))
 
-        new_choice = np.asarray(new_choice)
-        new_session = np.asarray(new_session)
-        new_date = np.asarray(new_date)
-        return new_p, new_x0, new_x1, new_choice, new_session, new_date
+            for idx, date in enumerate(self.get_dates()):
+
+                cursor.execute(query.format(self.get_session_table(date)))
+
+                while True:
+
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+
+                    chunk = self.make_chunk(rows, [idx, ] * len(rows), [date, ] * len(rows), valid_only)
+                    if len(chunk["date"]):
+                        yield chunk
+
+        cursor.close()
 
     def run(self):
 
         log("Import data for {}.".format(self.monkey), self.name)
 
-        dates = self.get_dates()
+        if self.use_cache:
+            error, p, x0, x1, choice, session, date = \
+                TrialsCache(database=self.db, monkey=self.monkey, long_format=self.long_format) \
+                .get(starting_point=self.iso_date(self.starting_point), end_point=self.iso_date(self.end_point))
+
+            assert len(date), "Fatal: No valid dates found, \n" \
+                "Please give a look at the analysis parameters (analysis/parameters/parameters.py)."
+
+        elif self.long_format:
+            error, p, x0, x1, choice, session, date = self.get_errors_p_x0_x1_choices_from_long_format()
 
-        assert len(dates), "Fatal: No valid dates found, \n" \
-            "Please give a look at the analysis parameters (analysis/parameters/parameters.py)."
+            assert len(date), "Fatal: No valid dates found, \n" \
+                "Please give a look at the analysis parameters (analysis/parameters/parameters.py)."
+
+        else:
+            dates = self.get_dates()
+
+            assert len(dates), "Fatal: No valid dates found, \n" \
+                "Please give a look at the analysis parameters (analysis/parameters/parameters.py)."
+
+            error, p, x0, x1, choice, session, date = self.get_errors_p_x0_x1_choices_from_db(dates)
 
-        error, p, x0, x1, choice, session, date = self.get_errors_p_x0_x1_choices_from_db(dates)
         p, x0, x1, choice, session, date = self.filter_valid_trials(error, p, x0, x1, choice, session, date)
 
         assert sum(x1["left"]) == 0 and sum(x1["right"]) == 0
@@ -172,12 +276,22 @@ class DataManager(object):
         return {"p": p, "x0": x0, "x1": x1, "choice": choice, "session": session, "date": date}
 
 
-def import_data(monkey, starting_point="2016-12-01", end_point=today(), database_path=None):
+def import_data(monkey, starting_point="2016-12-01", end_point=today(), database_path=None, long_format=None,
+                use_cache=False):
 
-    d = DataManager(monkey=monkey, starting_point=starting_point, end_point=end_point, database_path=database_path)
+    d = DataManager(monkey=monkey, starting_point=starting_point, end_point=end_point, database_path=database_path,
+                    long_format=long_format, use_cache=use_cache)
     return d.run()
 
 
+def iter_trials(monkey, starting_point="2016-12-01", end_point=today(), chunk_size=1000, database_path=None,
+                long_format=None, valid_only=True):
+
+    d = DataManager(monkey=monkey, starting_point=starting_point, end_point=end_point, database_path=database_path,
+                    long_format=long_format)
+    return d.iter_trials(chunk_size=chunk_size, valid_only=valid_only)
+
+
 def main():
 
     d = DataManager(monkey='Havane', starting_point="2016-08-01", end_point=today())
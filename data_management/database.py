@@ -1,6 +1,9 @@
 from sqlite3 import connect, OperationalError
+from contextlib import contextmanager
+from threading import local
 import os
 import json
+import numpy as np
 
 from utils.utils import log
 
@@ -9,7 +12,12 @@ class Database(object):
 
     name = "Database"
 
-    def __init__(self, database_path=None):
+    synchronous_levels = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+    def __init__(self, database_path=None, synchronous="NORMAL", journal_mode="WAL", long_format=False):
+
+        # If True, sessions are saved in the normalized 'sessions' / 'trials' tables (see 'long_format.py')
+        self.long_format = long_format
 
         if database_path is None:
             parameters_folder = os.path.abspath("{}/../parameters".format(os.path.dirname(os.path.abspath(__file__))))
@@ -19,74 +27,173 @@ class Database(object):
             database_folder = os.path.expanduser(param["database_folder"])
             os.makedirs(database_folder, exist_ok=True)
             self.db_path = os.path.join(database_folder, param["database_name"])
+            self.long_format = param.get("long_format", long_format)
 
         else:
             self.db_path = database_path
 
+        assert synchronous.upper() in self.synchronous_levels, \
+            "Synchronous level should be one of {}.".format(self.synchronous_levels)
+
+        self.synchronous = synchronous.upper()
+        self.journal_mode = journal_mode
+
         self.table_name = None
-        self.connexion = None
-        self.cursor = None
+
+        # One long-lived connexion per thread (sqlite3 objects can not be shared between threads)
+        self.local = local()
 
         self.types = {int: "INTEGER", float: "REAL", str: "TEXT", list: "TEXT"}
 
-    def table_exists(self, table_name):
+        # Table name -> list of columns (None until requested), see 'load_catalog'
+        self.catalog = None
+        self.schema_version = None
+
+    # ------------------------------------- CATALOG ------------------------------------------------------------- #
 
-        r = 0
+    def load_catalog(self):
 
-        if os.path.exists(self.db_path):
+        # Tables (and their columns, loaded lazily) are cached and only re-read when the schema has changed,
+        # including when it has been changed by another connexion ('schema_version' is increased by every change).
+        schema_version = self.read("PRAGMA schema_version")[0][0]
+
+        if self.catalog is None or schema_version != self.schema_version:
 
             # noinspection SqlResolve
-            already_existing = self.read("SELECT name FROM sqlite_master WHERE type='table'")
+            tables = self.read("SELECT name FROM sqlite_master WHERE type='table'")
+
+            self.catalog = {i[0]: None for i in tables}
+            self.schema_version = schema_version
 
-            if already_existing:
+        return self.catalog
 
-                already_existing = [i[0] for i in already_existing]
+    def update_catalog(self, table_name, columns):
 
-                if table_name in already_existing:
-                    r = 1
+        # Keep catalog in sync after a change in schema made by this object ('columns' is None for a removal).
+        # If the schema has also been modified by someone else in the meantime, the catalog is reloaded instead.
+        schema_version = self.read("PRAGMA schema_version")[0][0]
+
+        if self.catalog is not None and schema_version == self.schema_version + 1:
+
+            if columns is None:
+                self.catalog.pop(table_name, None)
+            else:
+                self.catalog[table_name] = columns
+
+            self.schema_version = schema_version
 
         else:
-            pass
+            self.catalog = None
+
+    def table_exists(self, table_name):
+
+        if not os.path.exists(self.db_path):
+            return 0
+
+        return int(table_name in self.load_catalog())
 
-        return r
+    def columns(self, table_name):
+
+        catalog = self.load_catalog()
+
+        if catalog.get(table_name) is None:
+            catalog[table_name] = [i[1] for i in self.read("PRAGMA table_info(`{}`)".format(table_name))]
+
+        return catalog[table_name]
+
+    # ------------------------------------- TABLES -------------------------------------------------------------- #
+
+    def sql_type(self, python_type):
+
+        # 'bool' is a subclass of 'int' but has always been stored as text
+        if issubclass(python_type, bool):
+            return "TEXT"
+
+        elif issubclass(python_type, np.integer):
+            return self.types[int]
+
+        elif issubclass(python_type, np.floating):
+            return self.types[float]
+
+        for key, value in self.types.items():
+            if issubclass(python_type, key):
+                return value
+
+        return "TEXT"
+
+    @staticmethod
+    def sql_value(value):
+
+        # Values are bound with their native SQLite type; anything else is stored as text
+        if value is None or type(value) in (int, float, str):
+            return value
+
+        elif isinstance(value, (np.integer, np.floating)):
+            return value.item()
+
+        else:
+            return str(value)
 
     def create_table(self, table_name, columns):
 
+        self.load_catalog()
+
         query = "CREATE TABLE `{}` (" \
                 "ID INTEGER PRIMARY KEY AUTOINCREMENT, ".format(table_name)
         for key, value in columns.items():
 
-            if value in self.types:
-                v = self.types[value]
-            else:
-                v = "TEXT"
-
-            query += "{} {}, ".format(key, v)
+            query += "{} {}, ".format(key, self.sql_type(value))
 
         query = query[:-2]
         query += ")"
         self.write(query)
 
+        self.update_catalog(table_name, ["ID"] + list(columns.keys()))
+
+    def create_index(self, table_name, columns):
+
+        query = "CREATE INDEX IF NOT EXISTS `idx_{}_{}` ON `{}` ({})".format(
+            table_name, "_".join(columns), table_name, ", ".join(columns))
+        self.write(query)
+
     def fill_table(self, table_name, **kwargs):
 
-        query = "INSERT INTO `{}` (".format(table_name)
-        for i in kwargs.keys():
-            query += "{}, ".format(i)
+        self.fill_table_many(table_name, [kwargs])
 
-        query = query[:-2]
-        query += ") VALUES("
-        for j in kwargs.values():
-            query += '''"{}", '''.format(j)
+    def fill_table_many(self, table_name, rows, columns=None):
 
-        query = query[:-2]
-        query += ")"
+        # Insert every row with a single 'executemany' in one transaction. Rows are either dictionaries sharing
+        # the same keys, or sequences of values ordered as 'columns'.
+        if not len(rows):
+            return
+
+        if columns is None:
+            columns = list(rows[0].keys())
+            rows = ([row[column] for column in columns] for row in rows)
+
+        query = "INSERT INTO `{}` ({}) VALUES ({})".format(
+            table_name, ", ".join(columns), ", ".join(["?"] * len(columns)))
+
+        values = ([self.sql_value(value) for value in row] for row in rows)
 
         try:
-            self.write(query)
+            with self.transaction() as cursor:
+                cursor.executemany(query, values)
+
         except OperationalError as e:
             log("Database: Error with query: {}".format(query), self.name)
             raise e
 
+    @property
+    def connexion(self):
+
+        return getattr(self.local, "connexion", None)
+
+    @property
+    def cursor(self):
+
+        return getattr(self.local, "cursor", None)
+
     def read(self, query):
 
         self.open()
@@ -99,27 +206,67 @@ class Database(object):
 
         content = self.cursor.fetchall()
 
-        self.close()
-
         return content
 
     def write(self, query):
 
         self.open()
         self.cursor.execute(query)
-        self.close()
+
+    @contextmanager
+    def transaction(self):
+
+        # Group every write made inside the 'with' block in a single transaction (committed at the end of the block,
+        # rolled back if an exception is raised). Nested calls are merged in the outermost transaction.
+
+        self.open()
+
+        if self.local.depth == 0:
+            self.cursor.execute("BEGIN")
+
+        self.local.depth += 1
+
+        try:
+            yield self.cursor
+
+        except BaseException:
+            self.local.depth -= 1
+            if self.local.depth == 0:
+                self.connexion.rollback()
+            raise
+
+        else:
+            self.local.depth -= 1
+            if self.local.depth == 0:
+                self.connexion.commit()
 
     def open(self):
 
-        # Create connexion to the database
-        self.connexion = connect(self.db_path)
-        self.cursor = self.connexion.cursor()
+        # Create connexion to the database (only once per thread)
+        if self.connexion is None:
+
+            # 'isolation_level=None': autocommit, transactions are explicitly opened by 'transaction'
+            connexion = connect(self.db_path, isolation_level=None)
+            connexion.execute("PRAGMA journal_mode={}".format(self.journal_mode))
+            connexion.execute("PRAGMA synchronous={}".format(self.synchronous))
+
+            self.local.connexion = connexion
+            self.local.cursor = connexion.cursor()
+            self.local.depth = 0
 
     def close(self):
 
-        # Save modifications and close connexion.
-        self.connexion.commit()
-        self.connexion.close()
+        # Close connexion of the current thread (rolling back any pending transaction).
+        if self.connexion is not None:
+
+            if self.local.depth:
+                log("Database: Close with a pending transaction that will be rolled back.", self.name)
+                self.connexion.rollback()
+
+            self.connexion.close()
+            self.local.connexion = None
+            self.local.cursor = None
+            self.local.depth = 0
 
     def empty(self, table_name):
 
@@ -129,9 +276,13 @@ class Database(object):
 
     def remove(self, table_name):
 
+        self.load_catalog()
+
         query = "DROP TABLE `{}`".format(table_name)
         self.write(query)
 
+        self.update_catalog(table_name, None)
+
     def read_column(self, table_name, column_name, **kwargs):
 
         if not kwargs:
@@ -0,0 +1,230 @@
+from datetime import datetime
+from threading import Thread
+import glob
+import json
+import os
+import sys
+
+from data_management.database import Database
+from utils.channel import channel
+from utils.utils import log
+
+
+class Journal(object):
+
+    # Append-only copy (one JSON line per trial) of the session being run, written on the fly, so that trials
+    # are not lost if the program or the computer crashes before they reach the database.
+    # Once a session is in the database, its journal is removed; remaining journals are replayed at next start.
+    # How many trials of a journal are already in the database is saved in the database itself ('journals' table),
+    # in the transaction that saves these trials, so that a replay never saves a trial twice.
+
+    name = "Journal"
+
+    progress_table = "journals"
+
+    def __init__(self, folder=None, fsync_every=10):
+
+        self.folder = folder if folder is not None else self.default_folder()
+
+        # 'flush' after every trial protects against a crash of the program, 'fsync' against a power loss.
+        # 'fsync' (and 'close', that waits for the disk) is done by a worker thread, so that the task never
+        # waits for the disk.
+        self.fsync_every = fsync_every
+
+        self.file = None
+        self.path = None
+        self.n_unsynced = 0
+
+        # (file, if it has to be closed after 'fsync'); None to stop the worker
+        self.sync_queue = channel()
+        self.worker = None
+
+    @staticmethod
+    def default_folder(database_path=None):
+
+        return os.path.join(os.path.dirname(os.path.abspath(Database(database_path).db_path)), "journal")
+
+    # ------------------------------------- WRITE ------------------------------------------------------------- #
+
+    @staticmethod
+    def encode(value):
+
+        # NumPy scalars
+        if hasattr(value, "item"):
+            return value.item()
+        return str(value)
+
+    def write(self, entry):
+
+        self.file.write(json.dumps(entry, default=self.encode) + "\n")
+        self.file.flush()
+
+        self.n_unsynced += 1
+        if self.n_unsynced >= self.fsync_every:
+            self.sync()
+
+    def sync(self, close=False):
+
+        self.sync_queue.put((self.file, close))
+        self.n_unsynced = 0
+
+    def run_syncs(self):
+
+        while True:
+
+            order = self.sync_queue.get()
+            if order is None:
+                break
+
+            file, close = order
+
+            try:
+                os.fsync(file.fileno())
+            except (OSError, ValueError) as e:
+                log("Could not sync journal: {}.".format(e), self.name)
+
+            if close:
+                file.close()
+
+    def open(self, parameters):
+
+        self.close()
+
+        if self.worker is None:
+            self.worker = Thread(target=self.run_syncs, daemon=True)
+            self.worker.start()
+
+        os.makedirs(self.folder, exist_ok=True)
+
+        self.path = os.path.join(self.folder, "session_{}_{}.jsonl".format(
+            datetime.now().strftime("%Y_%m_%d_%H_%M_%S_%f"), parameters["monkey"]))
+        self.file = open(self.path, "a")
+
+        parameters = {key: value for key, value in parameters.items() if key != "save"}
+        self.write({"parameters": parameters, "date": datetime.now().strftime("%Y-%m-%d")})
+        self.sync()
+
+        log("Journal opened: '{}'.".format(self.path), self.name)
+
+        return self.path
+
+    def append(self, trial):
+
+        if self.file is not None:
+            self.write({"trial": trial.as_dict()})
+
+    def close(self):
+
+        if self.file is not None:
+            self.sync(close=True)
+            self.file = None
+
+    def end(self):
+
+        # Wait for the last syncs
+        self.close()
+
+        if self.worker is not None:
+            self.sync_queue.put(None)
+            self.worker.join()
+            self.worker = None
+
+    # ------------------------------------- READ -------------------------------------------------------------- #
+
+    @staticmethod
+    def read(path):
+
+        # Return parameters, date and trials; a last line truncated by a crash is ignored
+        parameters, date, trials = None, None, []
+
+        with open(path) as file:
+            for line in file:
+
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+
+                if "parameters" in entry:
+                    parameters, date = entry["parameters"], entry["date"]
+                else:
+                    trials.append(entry["trial"])
+
+        return parameters, date, trials
+
+    # ------------------------------------- PROGRESS ---------------------------------------------------------- #
+
+    @classmethod
+    def create_progress_table(cls, database):
+
+        if not database.table_exists(cls.progress_table):
+
+            database.write(
+                "CREATE TABLE `{}` ("
+                "ID INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "journal TEXT UNIQUE, session_table TEXT, session_id INTEGER, n_trials INTEGER)"
+                .format(cls.progress_table))
+            database.update_catalog(cls.progress_table, ["ID", "journal", "session_table", "session_id", "n_trials"])
+
+            log("Table '{}' created.".format(cls.progress_table), cls.name)
+
+    @classmethod
+    def read_progress(cls, database, path):
+
+        # Where the trials of the journal are saved in the database and how many of them are already there
+        progress = {"session_table": None, "session_id": None, "n_trials": 0}
+
+        if database.table_exists(cls.progress_table):
+
+            database.open()
+            # noinspection SqlResolve
+            row = database.cursor.execute(
+                "SELECT session_table, session_id, n_trials FROM `{}` WHERE journal = ?".format(cls.progress_table),
+                (os.path.basename(path), )).fetchone()
+
+            if row is not None:
+                progress["session_table"], progress["session_id"], progress["n_trials"] = row
+
+        return progress
+
+    @classmethod
+    def write_progress(cls, database, path, session_table, session_id, n_trials):
+
+        # To be called inside the transaction that saves the trials
+        with database.transaction() as cursor:
+
+            cls.create_progress_table(database)
+
+            # noinspection SqlResolve
+            cursor.execute(
+                "INSERT OR REPLACE INTO `{}` (journal, session_table, session_id, n_trials) VALUES (?, ?, ?, ?)"
+                .format(cls.progress_table), (os.path.basename(path), session_table, session_id, n_trials))
+
+    @staticmethod
+    def remove(path):
+
+        if os.path.exists(path):
+            os.remove(path)
+
+    @staticmethod
+    def unfinished(folder):
+
+        return sorted(glob.glob(os.path.join(folder, "session_*.jsonl")))
+
+
+def main():
+
+    # Replay in the database the journals of sessions that have not been entirely saved
+    from data_management.session_writer import SessionWriter
+
+    database_path = sys.argv[1] if len(sys.argv) > 1 else None
+
+    session_writer = SessionWriter(database_path=database_path)
+    session_writer.start()
+    session_writer.end()
+    session_writer.join()
+
+
+if __name__ == "__main__":
+
+    main()
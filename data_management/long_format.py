@@ -0,0 +1,224 @@
+from collections import OrderedDict
+import json
+import sys
+
+from data_management.database import Database
+from utils.utils import log
+
+
+# Normalized schema: one 'sessions' table (a row per session) and one 'trials' table (a row per trial, keyed by
+# session id), instead of one table per session. Run this module for importing the existing session tables.
+class LongFormat(object):
+
+    name = "LongFormat"
+
+    sessions_table = "sessions"
+    trials_table = "trials"
+
+    def __init__(self, database=None):
+
+        self.db = database if database is not None else Database()
+
+    # ------------------------------------- SCHEMA ------------------------------------------------------------ #
+
+    def create_tables(self):
+
+        if not self.db.table_exists(self.sessions_table):
+
+            self.db.write(
+                "CREATE TABLE `{}` ("
+                "ID INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "monkey TEXT, date TEXT, session_table TEXT UNIQUE, parameters TEXT)".format(self.sessions_table))
+            self.db.update_catalog(self.sessions_table, ["ID", "monkey", "date", "session_table", "parameters"])
+            self.db.create_index(self.sessions_table, ["monkey", "date"])
+
+            log("Table '{}' created.".format(self.sessions_table), self.name)
+
+        if not self.db.table_exists(self.trials_table):
+
+            self.db.write(
+                "CREATE TABLE `{}` ("
+                "ID INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "session_id INTEGER REFERENCES `{}` (ID))".format(self.trials_table, self.sessions_table))
+            self.db.update_catalog(self.trials_table, ["ID", "session_id"])
+
+            log("Table '{}' created.".format(self.trials_table), self.name)
+
+    def trials_columns(self):
+
+        return self.db.columns(self.trials_table)
+
+    def add_trials_columns(self, columns):
+
+        # Columns are added on demand, so that a change in what is saved per trial does not require a migration
+        existing = self.trials_columns()
+
+        for key, value in columns.items():
+            if key not in existing:
+                self.db.write("ALTER TABLE `{}` ADD COLUMN {} {}"
+                              .format(self.trials_table, key, self.db.sql_type(value)))
+
+        # Indexes can only be created once the indexed column exists
+        self.db.create_index(self.trials_table, ["session_id"])
+        if "error" in columns or "error" in existing:
+            self.db.create_index(self.trials_table, ["error"])
+
+    # ------------------------------------- WRITE ------------------------------------------------------------- #
+
+    def save_session(self, monkey, date, parameters, trials, session_table=None):
+
+        with self.db.transaction():
+
+            session_id = self.new_session(monkey=monkey, date=date, parameters=parameters,
+                                          session_table=session_table)
+            self.add_trials(session_id, trials)
+
+        log("Session {} saved with {} trials.".format(session_id, len(trials)), self.name)
+
+        return session_id
+
+    def new_session(self, monkey, date, parameters, session_table=None):
+
+        self.create_tables()
+
+        with self.db.transaction() as cursor:
+
+            cursor.execute(
+                "INSERT INTO `{}` (monkey, date, session_table, parameters) VALUES (?, ?, ?, ?)"
+                .format(self.sessions_table),
+                (monkey, date, session_table, json.dumps(parameters, sort_keys=True, default=str)))
+
+            return cursor.lastrowid
+
+    def add_trials(self, session_id, trials, columns=None):
+
+        # Trials are either dictionaries, or sequences of values ordered as 'columns' (name -> type)
+        if columns is None:
+
+            columns = OrderedDict()
+            for trial in trials:
+                for key, value in sorted(trial.items()):
+                    if key not in columns or value is not None and columns[key] is type(None):
+                        columns[key] = type(value)
+
+            rows = [[session_id] + [trial.get(key) for key in columns] for trial in trials]
+
+        else:
+            rows = [[session_id] + list(trial) for trial in trials]
+
+        with self.db.transaction():
+
+            self.add_trials_columns(columns)
+            self.db.fill_table_many(self.trials_table, rows, columns=["session_id"] + list(columns.keys()))
+
+    # ------------------------------------- READ -------------------------------------------------------------- #
+
+    def read_trials(self, monkey, columns, starting_point=None, end_point=None, last_session_per_date=False):
+
+        query, args = self.trials_query(monkey, columns, starting_point, end_point, last_session_per_date)
+
+        self.db.open()
+        return self.db.cursor.execute(query, args).fetchall()
+
+    def trials_query(self, monkey, columns, starting_point=None, end_point=None, last_session_per_date=False):
+
+        query = "SELECT {} FROM `{}` AS t JOIN `{}` AS s ON t.session_id = s.ID WHERE s.monkey = ?".format(
+            ", ".join(columns), self.trials_table, self.sessions_table)
+        args = [monkey]
+
+        if last_session_per_date:
+            query += " AND s.ID IN (SELECT MAX(ID) FROM `{}` WHERE monkey = ? GROUP BY date)".format(
+                self.sessions_table)
+            args.append(monkey)
+
+        if starting_point is not None:
+            query += " AND s.date >= ?"
+            args.append(starting_point)
+
+        if end_point is not None:
+            query += " AND s.date <= ?"
+            args.append(end_point)
+
+        query += " ORDER BY s.date, t.session_id, t.ID"
+
+        return query, args
+
+    # ------------------------------------- MIGRATION --------------------------------------------------------- #
+
+    @staticmethod
+    def parse(value):
+
+        # Sessions saved with the legacy format have every value stored as a string
+        if value is None or value == "None":
+            return None
+
+        elif type(value) != str:
+            return value
+
+        for t in (int, float):
+            try:
+                return t(value)
+            except ValueError:
+                pass
+
+        return value
+
+    def migrate(self):
+
+        # Import every session table referenced in the 'summary' table (sessions already imported are skipped)
+        if not self.db.table_exists("summary"):
+            log("No summary table: nothing to migrate.", self.name)
+            return 0
+
+        self.create_tables()
+
+        already_imported = {i[0] for i in self.db.read(
+            "SELECT session_table FROM `{}` WHERE session_table IS NOT NULL".format(self.sessions_table))}
+
+        self.db.open()
+        self.db.cursor.execute("SELECT * FROM summary ORDER BY ID")
+        summary_columns = [i[0] for i in self.db.cursor.description]
+        summary = [OrderedDict(zip(summary_columns, row)) for row in self.db.cursor.fetchall()]
+
+        n = 0
+
+        for row in summary:
+
+            session_table = row["session_table"]
+
+            if session_table in already_imported:
+                continue
+
+            if not self.db.table_exists(session_table):
+                log("Session table '{}' not found, skip it.".format(session_table), self.name)
+                continue
+
+            self.db.cursor.execute("SELECT * FROM `{}` ORDER BY ID".format(session_table))
+            trials_columns = [i[0] for i in self.db.cursor.description]
+            trials = [
+                {key: self.parse(value) for key, value in zip(trials_columns, trial) if key != "ID"}
+                for trial in self.db.cursor.fetchall()
+            ]
+
+            parameters = {key: value for key, value in row.items()
+                          if key not in ("ID", "date", "session_table")}
+
+            self.save_session(monkey=row["monkey"], date=row["date"], parameters=parameters,
+                              trials=trials, session_table=session_table)
+            already_imported.add(session_table)
+            n += 1
+
+        log("{} session(s) migrated.".format(n), self.name)
+
+        return n
+
+
+def main():
+
+    database_path = sys.argv[1] if len(sys.argv) > 1 else None
+    LongFormat(Database(database_path)).migrate()
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,269 @@
+from collections import OrderedDict
+from datetime import date
+from queue import Empty
+from threading import Thread, Event
+
+from data_management.database import Database
+from data_management.journal import Journal
+from data_management.long_format import LongFormat
+from data_management.trial_record import TrialRecord
+from utils.channel import channel
+from utils.utils import log
+
+
+class SessionWriter(Thread):
+
+    # Save trials in the database as they are completed, from its own thread, so that the task never waits for
+    # the disk. Trials waiting in the queue are written together, in a single transaction.
+
+    name = "SessionWriter"
+
+    def __init__(self, database_path=None, batch_size=50):
+
+        super().__init__()
+
+        self.database_path = database_path
+        self.batch_size = batch_size
+
+        self.write_queue = channel()
+        self.shutdown = Event()
+
+        self.current_saving = Event()
+        self.data_saved = Event()
+        self.data_saved.set()
+
+        self.database = None
+
+        # Journals left by sessions that have not been entirely saved (listed before any new session begins)
+        self.to_recover = Journal.unfinished(Journal.default_folder(database_path))
+
+        # Relative to the current session
+        self.parameters = None
+        self.date = None
+        self.journal = None
+        self.session_table = None
+        self.session_id = None
+        self.n_trials = 0
+
+    def run(self):
+
+        log("Running.", self.name)
+
+        self.database = Database(self.database_path)
+
+        self.recover()
+
+        while not self.shutdown.is_set():
+
+            messages = [self.write_queue.get()]
+
+            # Gather every message already waiting for being handled
+            while True:
+                try:
+                    messages.append(self.write_queue.get_nowait())
+                except Empty:
+                    break
+
+            self.handle_messages(messages)
+
+        self.database.close()
+
+        log("DEAD.", self.name)
+
+    def handle_messages(self, messages):
+
+        trials = []
+
+        for message in messages:
+
+            if message is not None and message[0] == "trial":
+
+                trials.append(message[1])
+                if len(trials) >= self.batch_size:
+                    self.write_trials(trials)
+                    trials = []
+
+            else:
+                self.write_trials(trials)
+                trials = []
+
+                # 'None' is put last in the queue by 'end'
+                if message is None:
+                    self.shutdown.set()
+                else:
+                    self.handle_message(message)
+
+        self.write_trials(trials)
+
+    def handle_message(self, message):
+
+        if message[0] == "new_session":
+
+            self.parameters, self.date, self.journal = message[1:]
+            self.session_table = None
+            self.session_id = None
+            self.n_trials = 0
+
+        elif message[0] == "end_session":
+
+            if self.n_trials:
+                log("DATA SAVED ({} trials).".format(self.n_trials), self.name)
+            else:
+                log("No trials to save.", self.name)
+
+            # Everything is in the database: journal is not needed anymore
+            if self.journal is not None:
+                Journal.remove(self.journal)
+
+            self.parameters = None
+            self.journal = None
+            self.n_trials = 0
+
+            self.current_saving.clear()
+            self.data_saved.set()
+
+        else:
+            raise Exception("{}: Received message '{}' but did'nt expected anything like that."
+                            .format(self.name, message))
+
+    # ------------------------------------- INTERFACE FOR THE MANAGER ---------------------------------------- #
+
+    def new_session(self, parameters, journal=None):
+
+        self.data_saved.clear()
+        self.current_saving.set()
+
+        parameters = parameters.copy()
+        parameters.pop("save", None)
+        self.write_queue.put(("new_session", parameters, str(date.today()), journal))
+
+    def write_trial(self, trial):
+
+        self.write_queue.put(("trial", trial))
+
+    def end_session(self):
+
+        self.write_queue.put(("end_session", ))
+
+    def end(self):
+
+        # Trials still in the queue are written before dying
+        self.write_queue.put(None)
+
+    # ------------------------------------- WRITE ------------------------------------------------------------- #
+
+    def write_trials(self, trials):
+
+        if not trials:
+            return
+
+        if self.parameters is None:
+            log("Trials received outside of a session will not be saved.", self.name)
+            return
+
+        with self.database.transaction():
+
+            if self.database.long_format:
+
+                long_format = LongFormat(self.database)
+
+                if self.session_id is None:
+                    self.session_id = long_format.new_session(
+                        monkey=self.parameters["monkey"], date=self.date, parameters=self.parameters)
+
+                long_format.add_trials(self.session_id, [trial.values() for trial in trials],
+                                       columns=TrialRecord.columns)
+
+            else:
+
+                if self.session_table is None:
+                    self.session_table = self.create_session_table()
+
+                self.database.fill_table_many(self.session_table, [trial.values() for trial in trials],
+                                              columns=TrialRecord.column_names)
+
+            # Committed with the trials: a replay of the journal goes on from there
+            if self.journal is not None:
+                Journal.write_progress(self.database, self.journal, self.session_table, self.session_id,
+                                       self.n_trials + len(trials))
+
+        self.n_trials += len(trials)
+
+    def recover(self):
+
+        for journal in self.to_recover:
+
+            parameters, session_date, trials = Journal.read(journal)
+            progress = Journal.read_progress(self.database, journal)
+
+            if parameters is not None:
+
+                log("Recover {} trial(s) from '{}'.".format(len(trials) - progress["n_trials"], journal), self.name)
+
+                self.parameters, self.date, self.journal = parameters, session_date, journal
+                self.session_table, self.session_id = progress["session_table"], progress["session_id"]
+                self.n_trials = progress["n_trials"]
+
+                trials = [TrialRecord(**trial) for trial in trials[self.n_trials:]]
+                for i in range(0, len(trials), self.batch_size):
+                    self.write_trials(trials[i:i + self.batch_size])
+
+            Journal.remove(journal)
+
+        self.parameters, self.date, self.journal = None, None, None
+        self.session_table, self.session_id, self.n_trials = None, None, 0
+        self.to_recover = []
+
+    def create_session_table(self):
+
+        summary_table_name = "summary"
+
+        # Verify if a summary table exists, otherwise, create it
+        if not self.database.table_exists(summary_table_name):
+
+            columns = OrderedDict()
+
+            # Add columns for date and name of session table
+            columns["date"] = str
+            columns["session_table"] = str
+
+            # Add a column for every parameter in parameter dic
+            for key, value in sorted(self.parameters.items()):
+                columns[key] = type(value)
+            self.database.create_table(
+                table_name=summary_table_name,
+                columns=columns)
+            self.database.create_index(summary_table_name, ["monkey", "date"])
+
+            log("Summary table created.", self.name)
+
+        else:
+            log("Summary table already exists.", self.name)
+
+        # Create a session table
+        log("Create session table.", self.name)
+        monkey = self.parameters["monkey"]
+        session_table_name = "session_{}_{}".format(self.date.replace("-", "_"), monkey)
+        if self.database.table_exists(table_name=session_table_name):
+
+            log("Session table with name {} already exists.".format(session_table_name), self.name)
+
+            idx = 2
+            session_table_name += "({})".format(idx)
+            while self.database.table_exists(table_name=session_table_name):
+                log("Session table with name {} already exists.".format(session_table_name), self.name)
+                session_table_name = session_table_name.replace("({})".format(idx), "({})".format(idx+1))
+                idx += 1
+
+        self.database.create_table(
+            table_name=session_table_name,
+            columns=TrialRecord.columns
+        )
+
+        log("Session table created with name {}.".format(session_table_name), self.name)
+
+        # Fill summary table
+        self.database.fill_table(summary_table_name, **self.parameters, date=self.date,
+                                 session_table=session_table_name)
+
+        return session_table_name
@@ -0,0 +1,80 @@
+from collections import OrderedDict
+
+
+class TrialRecord(object):
+
+    # What is saved for every trial. The schema ('columns': name -> type) is used both for filling the record
+    # and for creating the tables of the database. Timings are in milliseconds.
+    # '..._actual': duration of the epoch as it happened (from the launch of its timer to the handling of its end),
+    # to be compared with the requested one. 'timer_lateness_max': worst delay of the scheduler over the trial.
+    # '..._ttl' and 'time_stamp_valve_onset': when the Raspberry Pi actually sent the TTL signal / opened the valve
+    # (first opening of the reward), according to its clock.
+
+    columns = OrderedDict([
+        ("choice", str),
+        ("dice_output", int),
+        ("error", str),
+        ("gauge_level", int),
+        ("left_beginning_angle", int),
+        ("left_p", float),
+        ("left_x0", int),
+        ("left_x1", int),
+        ("n_block", int),
+        ("n_trial_inside_block", int),
+        ("right_beginning_angle", int),
+        ("right_p", float),
+        ("right_x0", int),
+        ("right_x1", int),
+        ("time_back_movement", int),
+        ("time_fixation", int),
+        ("time_fixation_actual", float),
+        ("time_inter_block", int),
+        ("time_inter_block_actual", float),
+        ("time_inter_trial", int),
+        ("time_inter_trial_actual", float),
+        ("time_movement", int),
+        ("time_punishment_actual", float),
+        ("time_reaction", int),
+        ("time_result_display_actual", float),
+        ("time_reward_actual", float),
+        ("time_stamp_cue_contact", int),
+        ("time_stamp_cue_onset", int),
+        ("time_stamp_cue_onset_ttl", int),
+        ("time_stamp_grip_onset", int),
+        ("time_stamp_inter_block_interval_onset", int),
+        ("time_stamp_inter_trial_interval_onset", int),
+        ("time_stamp_release_grip", int),
+        ("time_stamp_result_period_onset", int),
+        ("time_stamp_reward_period_onset", int),
+        ("time_stamp_valve_onset", int),
+        ("timer_lateness_max", float),
+    ])
+
+    column_names = tuple(columns.keys())
+
+    __slots__ = column_names
+
+    def __init__(self, **kwargs):
+
+        for name in self.column_names:
+            setattr(self, name, kwargs.pop(name, None))
+
+        assert not kwargs, "Unknown column(s) for a trial: {}.".format(list(kwargs.keys()))
+
+    def values(self):
+
+        return tuple(getattr(self, name) for name in self.column_names)
+
+    def as_dict(self):
+
+        return OrderedDict(zip(self.column_names, self.values()))
+
+    # Only values are pickled (e.g. if a record is sent through a multiprocessing queue)
+    def __getstate__(self):
+
+        return self.values()
+
+    def __setstate__(self, state):
+
+        for name, value in zip(self.column_names, state):
+            setattr(self, name, value)
@@ -2,11 +2,13 @@ from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
 from PyQt5.QtMultimedia import *
 from collections import OrderedDict
-from multiprocessing import Queue, Event
+from multiprocessing import Event
 import sys
 from os import path
-from time import time
+from time import time, perf_counter
 
+from utils.channel import channel
+from utils.tracing import Tracer
 from utils.utils import log
 from graphics.generic import Frame
 from graphics.gauge import Gauge
@@ -24,11 +26,12 @@ class GameWindow(QMainWindow):
     init_width = 900
     init_height = 0.625 * init_width
 
-    def __init__(self, queues, textures_folder, standalone=False):
+    def __init__(self, queues, textures_folder, standalone=False, tracer=None):
 
         QWidget.__init__(self)
 
         self.queues = queues
+        self.tracer = tracer if tracer is not None else Tracer()
         self.standalone = standalone
         self.textures_folder = textures_folder
 
@@ -286,13 +289,13 @@ class GameWindow(QMainWindow):
 
             if self.frames["left"].ellipse.contains(event.pos()):
                 log("CLICK LEFT.", self.name)
-                self.queues["manager"].put(("game", "choice", "left"))
+                self.queues["manager"].put(self.tracer.start(("game", "choice", "left"), "click"))
                 # self.play_sound("choice")
                 self.detect_choices.clear()
 
             if self.frames["right"].ellipse.contains(QPoint(event.x() - self.width()*(4/7), event.y())):
                 log("CLICK RIGHT.", self.name)
-                self.queues["manager"].put(("game", "choice", "right"))
+                self.queues["manager"].put(self.tracer.start(("game", "choice", "right"), "click"))
                 # self.play_sound("choice")
                 self.detect_choices.clear()
 
@@ -336,7 +339,7 @@ class GameWindow(QMainWindow):
             if not event.isAutoRepeat():
                 log("PRESS 'P'.", self.name)
 
-                self.fake_grip_queue.put(1)
+                self.fake_grip_queue.put((1, perf_counter()))
                 self.fake_grip_value.value = 1
 
         elif self.control_modifier and event.key() == Qt.Key_F:
@@ -351,7 +354,7 @@ class GameWindow(QMainWindow):
 
         elif self.fake_grip_queue and event.key() == Qt.Key_P:
 
-            self.fake_grip_queue.put(0)
+            self.fake_grip_queue.put((0, perf_counter()))
             self.fake_grip_value.value = 0
 
 # ----------------------------------------- RESIZE EVENT ------------------------------------------------ #
@@ -402,7 +405,7 @@ class Viewer(object):
     def __init__(self):
 
         self.window = GameWindow(
-            queues={"manager": Queue(), "interface": Queue()},
+            queues={"manager": channel(), "interface": channel()},
             textures_folder=self.textures_folder, standalone=True
         )
 
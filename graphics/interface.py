@@ -1,6 +1,6 @@
 import json
 import sys
-from multiprocessing import Queue, Event
+from multiprocessing import Event
 from os import path
 
 from PyQt5.QtWidgets import QWidget, QGridLayout, QPushButton, QMessageBox, QApplication
@@ -9,6 +9,8 @@ from graphics.parametrisation import ParametersContainer
 from graphics.progression_bar import ProgressionBar
 from graphics.trial_counter import TrialCounter
 from graphics.game_window import GameWindow
+from utils.channel import channel
+from utils.tracing import Tracer
 from utils.utils import log
 from graphics.generic import Communicant
 
@@ -18,15 +20,16 @@ class Interface(QWidget):
     name = "Interface"
     dir_path = path.dirname(path.realpath(__file__))
 
-    def __init__(self, communicant, queues, shutdown):
+    def __init__(self, communicant, queues, shutdown, tracer=None):
 
         QWidget.__init__(self)
 
         self.communicant = communicant
         self.queues = queues
         self.shutdown = shutdown
-        
-        self.game_window = GameWindow(queues=queues, textures_folder="textures")
+        self.tracer = tracer if tracer is not None else Tracer()
+
+        self.game_window = GameWindow(queues=queues, textures_folder="textures", tracer=self.tracer)
 
         self.grid = QGridLayout()
 
@@ -159,9 +162,12 @@ class Interface(QWidget):
 
     def look_for_msg(self):
 
-        message = self.queues["interface"].get()
+        message = self.tracer.stamp(self.queues["interface"].get(), "interface")
         self.handle_message(message)
 
+        # Widgets are repainted synchronously by 'handle_message'
+        self.tracer.finish(self.tracer.stamp(message, "screen"))
+
     def handle_message(self, message):
 
         self.able_to_handle_message.wait()
@@ -273,7 +279,7 @@ if __name__ == "__main__":
 
     app = QApplication(sys.argv)
     c = Communicant()
-    q = {"graphic": Queue(), "manager": Queue()}
+    q = {"graphic": channel(), "manager": channel()}
     s = Event()
     window = Interface(queues=q, communicant=c, shutdown=s)
     window.show()
@@ -1,6 +1,6 @@
 # coding=utf-8
 import sys
-from multiprocessing import Queue, Value, Event
+from multiprocessing import Value, Event
 
 from PyQt5.QtGui import QIcon
 from PyQt5.QtWidgets import QApplication
@@ -8,6 +8,8 @@ from PyQt5.QtWidgets import QApplication
 from graphics.interface import Interface
 from graphics.generic import Communicant
 from task.experimentalist import Manager
+from utils.channel import channel
+from utils.tracing import Tracer
 # from utils.utils import git_report
 
 
@@ -21,23 +23,28 @@ if __name__ == "__main__":
     app = QApplication(sys.argv)
     app.setWindowIcon(QIcon("textures/monkey.png"))
 
+    # Manager, interface and their workers are threads of this process
     queues = {
-        "manager": Queue(),
-        "interface": Queue(),
-        "grip_queue": Queue(),
+        "manager": channel(),
+        "interface": channel(),
+        "grip_queue": channel(),
         "grip_value": Value('i', 0)
     }
 
     shutdown = Event()
     communicant = Communicant()
 
-    interface = Interface(queues=queues, communicant=communicant, shutdown=shutdown)
+    # Latency of messages from grip/timers/clicks to the screen (opt-in, see 'parameters/tracing.json')
+    tracer = Tracer.from_parameters()
+
+    interface = Interface(queues=queues, communicant=communicant, shutdown=shutdown, tracer=tracer)
 
     # Start process that will handle events
     experimentalist = Manager(
         queues=queues,
         communicant=communicant,
-        shutdown=shutdown
+        shutdown=shutdown,
+        tracer=tracer
     )
 
     experimentalist.start()
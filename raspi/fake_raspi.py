@@ -0,0 +1,157 @@
+from threading import Event, Thread
+import argparse
+import random
+
+from raspi import hardware
+from raspi.raspi_manager import Connexion, Grip, Server, TtlSignal, Valve
+
+"""
+Raspberry Pi program on simulated hardware, for running the task and testing the exchanges with the Raspberry Pi
+on any computer. Replies can be delayed (latency and jitter of the network) and the grip can follow a script.
+Run (from the root of the project), then set the address of the computer in 'parameters/raspberry_pi.json':
+
+    $ python -m raspi.fake_raspi --latency 0.5 --jitter 0.2 --grip "2:1,3:0" --repeat 0
+"""
+
+
+class DelayedConnexion(Connexion):
+
+    # Every message to the client is delayed by the latency of the server plus a random part (uniform between 0 and
+    # the jitter); messages are still received in the order they have been sent, as with TCP.
+
+    def __init__(self, server, reader, writer):
+
+        super().__init__(server=server, reader=reader, writer=writer)
+        self.last_deadline = 0.
+
+    def send(self, data):
+
+        delay = self.server.latency + random.uniform(0, self.server.jitter)
+        if delay <= 0:
+            super().send(data)
+            return
+
+        self.last_deadline = max(self.last_deadline, self.server.loop.time() + delay)
+        self.server.loop.call_at(self.last_deadline, Connexion.send, self, data)
+
+
+class FakeServer(Server):
+
+    connexion_class = DelayedConnexion
+
+    # 'latency', 'jitter': in seconds; 'ttl_pulse_time': duration of the TTL pulses (s)
+
+    def __init__(self, host="localhost", port=1556, latency=0., jitter=0., overlap="queue", ttl_pulse_time=0.02):
+
+        self.gpio = hardware.SimulatedGpio()
+        self.serial_port = hardware.SimulatedSerialPort()
+
+        super().__init__(grip=Grip(self.gpio), valve=Valve(self.serial_port, overlap=overlap),
+                         ttl_signal=TtlSignal(self.gpio, pulse_time=ttl_pulse_time), host=host, port=port)
+
+        self.latency = latency
+        self.jitter = jitter
+
+        self.thread = None
+
+    def set_grip(self, grip_state):
+
+        # As if the grip was held (1) or released (0)
+        self.gpio.set_level(self.grip.gpio_in, 1 - grip_state)
+
+    def start(self):
+
+        # Serve from a thread; return the address the server listens to
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+        self.ready.wait()
+
+        return self.address
+
+    def close(self):
+
+        if self.thread is not None:
+            self.stop()
+            self.thread.join()
+
+        self.valve.close()
+        self.ttl_signal.close()
+
+
+class GripScript(Thread):
+
+    # Grip changes as a list of (delay in seconds, grip state), played 'repeat' times (0: until 'stop')
+
+    def __init__(self, server, steps, repeat=1):
+
+        super().__init__(daemon=True)
+
+        self.server = server
+        self.steps = steps
+        self.repeat = repeat
+
+        self.shutdown = Event()
+
+    @staticmethod
+    def parse(script):
+
+        # "2:1,3:0": hold the grip after 2 s, release it 3 s later
+        steps = []
+        for step in script.split(","):
+            delay, grip_state = step.split(":")
+            steps.append((float(delay), int(grip_state)))
+
+        return steps
+
+    def run(self):
+
+        n = 0
+        while not self.shutdown.is_set() and (self.repeat == 0 or n < self.repeat):
+
+            for delay, grip_state in self.steps:
+                if self.shutdown.wait(delay):
+                    break
+                self.server.set_grip(grip_state)
+
+            n += 1
+
+    def stop(self):
+
+        self.shutdown.set()
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Raspberry Pi program on simulated hardware.")
+    parser.add_argument("--host", default="", help="Address to listen to (default: all interfaces)")
+    parser.add_argument("--port", type=int, default=1556)
+    parser.add_argument("--latency", type=float, default=0., help="Delay of every reply (ms)")
+    parser.add_argument("--jitter", type=float, default=0., help="Maximal random delay added to the latency (ms)")
+    parser.add_argument("--grip", help="Script of grip changes: 'delay (s):state,...'")
+    parser.add_argument("--repeat", type=int, default=1, help="Times the script is played (0: forever)")
+    parser.add_argument("--overlap", default="queue", choices=["queue", "extend", "drop"])
+    args = parser.parse_args()
+
+    server = FakeServer(host=args.host, port=args.port, latency=args.latency / 1000, jitter=args.jitter / 1000,
+                        overlap=args.overlap)
+
+    script = None
+    if args.grip:
+        script = GripScript(server, GripScript.parse(args.grip), repeat=args.repeat)
+        script.start()
+
+    try:
+        server.run()
+
+    except (SystemExit, KeyboardInterrupt) as e:
+        print("Got exception '{}' and will exit.".format(e))
+
+    finally:
+        if script is not None:
+            script.stop()
+        server.close()
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,165 @@
+from collections import deque
+from threading import Condition
+from time import monotonic
+
+"""
+Hardware used by the Raspberry Pi program: the pins (grip, TTL) and the serial port of the valve. The real backends
+import 'RPi.GPIO' and 'serial' only when they are created, so that the rest of the program can run on any computer
+with the simulated backends (see 'fake_raspi.py').
+"""
+
+
+class RaspberryGpio(object):
+
+    # Pins are numbered as on the Broadcom chip ('BCM')
+
+    def __init__(self):
+
+        import RPi.GPIO as GPIO
+
+        self.GPIO = GPIO
+        self.GPIO.setmode(GPIO.BCM)
+
+    def setup_input(self, pin):
+
+        self.GPIO.setup(pin, self.GPIO.IN)
+
+    def setup_output(self, pin, level=0):
+
+        self.GPIO.setup(pin, self.GPIO.OUT)
+        self.output(pin, level)
+
+    def input(self, pin):
+
+        return self.GPIO.input(pin)
+
+    def output(self, pin, level):
+
+        self.GPIO.output(pin, self.GPIO.HIGH if level else self.GPIO.LOW)
+
+    def add_event_detect(self, pin, callback, bounce_time):
+
+        # 'callback(pin)' is called from a thread of RPi.GPIO at every edge
+        self.GPIO.add_event_detect(pin, self.GPIO.BOTH, callback=callback, bouncetime=bounce_time)
+
+    def remove_event_detect(self, pin):
+
+        self.GPIO.remove_event_detect(pin)
+
+    def cleanup(self):
+
+        self.GPIO.cleanup()
+
+
+class SerialPort(object):
+
+    def __init__(self, port="/dev/ttyUSB0"):
+
+        import serial
+
+        self.serial = serial.Serial(port)
+
+    def write(self, data):
+
+        self.serial.write(data)
+
+    def close(self):
+
+        self.serial.close()
+
+
+class SimulatedGpio(object):
+
+    # Inputs are set with 'set_level' (e.g. by a script of grip changes); edges are given to the callbacks from
+    # the thread that sets the level. Outputs are kept with their time (last 'history' ones).
+
+    def __init__(self, history=10000):
+
+        self.levels = {}
+        self.callbacks = {}
+
+        self.outputs = deque(maxlen=history)
+        self.n_outputs = {}
+
+        self.changed = Condition()
+
+    def setup_input(self, pin):
+
+        # Inputs are pulled up
+        self.levels.setdefault(pin, 1)
+
+    def setup_output(self, pin, level=0):
+
+        self.output(pin, level)
+
+    def input(self, pin):
+
+        return self.levels[pin]
+
+    def output(self, pin, level):
+
+        with self.changed:
+            self.levels[pin] = int(bool(level))
+            self.outputs.append((monotonic(), pin, self.levels[pin]))
+            self.n_outputs[pin, self.levels[pin]] = self.n_outputs.get((pin, self.levels[pin]), 0) + 1
+            self.changed.notify_all()
+
+    def add_event_detect(self, pin, callback, bounce_time):
+
+        self.callbacks[pin] = callback
+
+    def remove_event_detect(self, pin):
+
+        self.callbacks.pop(pin, None)
+
+    def cleanup(self):
+
+        self.callbacks.clear()
+
+    def set_level(self, pin, level):
+
+        # What the outside world does to an input
+        level = int(bool(level))
+        if self.levels.get(pin) == level:
+            return
+
+        self.levels[pin] = level
+
+        callback = self.callbacks.get(pin)
+        if callback is not None:
+            callback(pin)
+
+    def wait_for_outputs(self, pin, level, count, timeout=None):
+
+        # Wait until 'pin' has been set 'count' times to 'level' (since the beginning); return False after 'timeout'
+        with self.changed:
+            return self.changed.wait_for(lambda: self.n_outputs.get((pin, level), 0) >= count, timeout=timeout)
+
+
+class SimulatedSerialPort(object):
+
+    # What is written is kept with its time (last 'history' writes)
+
+    def __init__(self, history=10000):
+
+        self.written = deque(maxlen=history)
+        self.n_written = 0
+
+        self.changed = Condition()
+
+    def write(self, data):
+
+        with self.changed:
+            self.written.append((monotonic(), data))
+            self.n_written += 1
+            self.changed.notify_all()
+
+    def close(self):
+
+        pass
+
+    def wait_for_writes(self, count, timeout=None):
+
+        # Wait until 'count' writes have been made (since the beginning); return False after 'timeout'
+        with self.changed:
+            return self.changed.wait_for(lambda: self.n_written >= count, timeout=timeout)
@@ -0,0 +1,54 @@
+from collections import namedtuple
+import struct
+
+"""
+Binary protocol between the task computer and the Raspberry Pi (module shared by both sides).
+
+Every message is a frame of fixed size: version, opcode, sequence number, time stamp, value.
+A reply has the opcode and the sequence number of its request, so that requests can be pipelined
+by several threads on the same connexion. The time stamp is taken with the monotonic clock of the
+Raspberry Pi (0 in requests). Grip events pushed to a subscriber have the sequence number 0.
+A 'CLOCK' request is answered immediately with the current time of the Raspberry Pi, so that the
+task computer can estimate the offset between the two clocks.
+"""
+
+VERSION = 1
+
+GRIP_POLL = 1
+GRIP_SUBSCRIBE = 2
+GRIP_EVENT = 3
+VALVE = 4
+TTL = 5
+CLOCK = 6
+ERROR = 255
+
+FRAME = struct.Struct("!BBIdi")
+
+Message = namedtuple("Message", ["opcode", "seq", "time_stamp", "value"])
+
+
+def pack(opcode, seq, time_stamp=0., value=0):
+
+    return FRAME.pack(VERSION, opcode, seq, time_stamp, value)
+
+
+def unpack(data):
+
+    version, opcode, seq, time_stamp, value = FRAME.unpack(data)
+    if version != VERSION:
+        raise ValueError("Protocol version {} not supported (expected {}).".format(version, VERSION))
+
+    return Message(opcode, seq, time_stamp, value)
+
+
+def recv_exactly(sock, n):
+
+    # Return b'' if the connexion is closed before 'n' bytes have been received
+    data = b""
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            return b""
+        data += chunk
+
+    return data
@@ -1,147 +1,446 @@
-import serial as sr
-from multiprocessing import Event, Process, Queue
-from time import time
+from threading import Event, Thread
+from time import time, monotonic
+import asyncio
+import queue
 import socket
-import RPi.GPIO as GPIO
+
+# Files are copied side by side on the Raspberry Pi, where this program is run as a script
+if __package__:
+    from raspi import hardware, protocol
+else:
+    import hardware
+    import protocol
 
 """
-Program intended to be executed on the Raspberry Pi
+Program intended to be executed on the Raspberry Pi (see 'fake_raspi.py' for running it anywhere else)
 """
 
 
-class TtlSignal(Process):
+class TtlSignal(Thread):
+
+    # Pulses are given by a worker thread; 'gpio': see 'hardware.py'. Orders are (callback, ): 'callback(time_stamp)'
+    # is called when the pin goes high.
 
-    def __init__(self):
+    def __init__(self, gpio, pin=19, pulse_time=0.02):
 
-        super().__init__()
-        self.queue = Queue()
+        super().__init__(daemon=True)
+        self.queue = queue.Queue()
         self.shutdown = Event()
 
-        self.gpio_out = 19
-        GPIO.setup(self.gpio_out, GPIO.OUT)
-        GPIO.output(self.gpio_out, GPIO.LOW)
+        self.gpio = gpio
+        self.gpio_out = pin
+        self.pulse_time = pulse_time
+        self.gpio.setup_output(self.gpio_out, 0)
 
         self.start()
-        self.queue.put(None)  # Initialize queue for avoiding a delay at first send
 
-    def _send(self):
+    def _send(self, callback):
 
-        GPIO.output(self.gpio_out, GPIO.HIGH)
-        Event().wait(0.02)
-        GPIO.output(self.gpio_out, GPIO.LOW)
+        self.gpio.output(self.gpio_out, 1)
+        if callback is not None:
+            callback(monotonic())
+
+        Event().wait(self.pulse_time)
+        self.gpio.output(self.gpio_out, 0)
 
     def run(self):
 
         while not self.shutdown.is_set():
 
             order = self.queue.get()
-            if order:
-                self._send()
+            if order is not None:
+                self._send(*order)
 
-    def send(self):
+    def send(self, callback=None):
 
-        self.queue.put(True)
+        self.queue.put((callback, ))
 
     def close(self):
         self.shutdown.set()
         self.queue.put(None)
 
 
-class Valve:
+class Valve(Thread):
+
+    # Pulses are given by a worker thread, so that the server keeps answering while the valve is open.
+    # 'overlap' tells what to do with an order received while the valve is open:
+    # 'queue': give the pulse after the current one; 'extend': keep the valve open until the end of the new pulse;
+    # 'drop': ignore the order. 'serial_port': see 'hardware.py'.
+
+    def __init__(self, serial_port, overlap="queue"):
+
+        super().__init__(daemon=True)
+
+        assert overlap in ("queue", "extend", "drop"), "Overlap policy '{}' not understood.".format(overlap)
+        self.overlap = overlap
 
-    def __init__(self):
+        self.ser = serial_port
 
-        self.serial_port = "/dev/ttyUSB0"
-        self.ser = sr.Serial(self.serial_port)
+        # Orders are (open time in ms, callback); 'callback(time_stamp, open_time)' is called when the valve opens
+        # (with an open time of 0 if the order is dropped)
+        self.queue = queue.Queue()
 
         self.timer = Event()
 
-    def launch(self, open_time):
+        self.start()
+
+    def launch(self, open_time, callback=None):
+
+        self.queue.put((open_time, callback))
+
+    def run(self):
+
+        while True:
+
+            order = self.queue.get()
+            if order is None:
+                break
+
+            self.pulse(*order)
+
+        self.ser.close()
+
+    def pulse(self, open_time, callback):
 
         a = time()
         self.ser.write("S11".encode())
-        self.timer.wait(timeout=open_time/1000.)
+        self.notify(callback, monotonic(), open_time)
+
+        deadline = monotonic() + open_time/1000.
+
+        if self.overlap == "queue":
+            self.timer.wait(timeout=open_time/1000.)
+        else:
+            self.wait_overlapping(deadline)
+
         self.ser.write("S10".encode())
         b = time()
         print("Open time of valve:", b-a)
 
+    def wait_overlapping(self, deadline):
+
+        while True:
+
+            try:
+                order = self.queue.get(timeout=max(0., deadline - monotonic()))
+            except queue.Empty:
+                break
+
+            if order is None:
+                # Close the valve now and let 'run' stop
+                self.queue.put(None)
+                break
+
+            open_time, callback = order
+
+            if self.overlap == "extend":
+                deadline = max(deadline, monotonic() + open_time/1000.)
+                self.notify(callback, monotonic(), open_time)
+            else:
+                print("Valve already open: order dropped.")
+                self.notify(callback, monotonic(), 0)
+
+    @staticmethod
+    def notify(callback, time_stamp, open_time):
+
+        if callback is not None:
+            callback(time_stamp, open_time)
+
     def close(self):
 
-        self.ser.close()
+        self.queue.put(None)
+        self.join()
 
 
 class Grip:
 
-    def __init__(self):
+    # 'gpio': see 'hardware.py'; input is low when the grip is held
+
+    def __init__(self, gpio, pin=26):
+
+        self.gpio = gpio
+        self.gpio_in = pin
+        self.gpio.setup_input(self.gpio_in)
 
-        self.gpio_in = 26
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(self.gpio_in, GPIO.IN)
+        self.callback = None
+        self.last_state = None
 
     def detect(self):
 
-        grip_state = 1 - GPIO.input(self.gpio_in)
+        grip_state = 1 - self.gpio.input(self.gpio_in)
         print("Grip state:", grip_state)
         return grip_state
 
+    def subscribe(self, callback, bounce_time=5):
 
-def main():
+        # 'callback(state, time_stamp)' will be called (from a thread of the GPIO backend) at every change of grip state.
+        # Return current state and time.
+        self.unsubscribe()
 
-    grip = Grip()
-    valve = Valve()
-    ttl_signal = TtlSignal()
+        self.callback = callback
+        self.last_state = 1 - self.gpio.input(self.gpio_in)
+        time_stamp = monotonic()
 
-    host = ''  # Symbolic name meaning all available interfaces
-    port = 1556  # Arbitrary non-privileged port
+        self.gpio.add_event_detect(self.gpio_in, callback=self._on_edge, bounce_time=bounce_time)
 
-    try:
+        return self.last_state, time_stamp
+
+    def unsubscribe(self):
+
+        if self.callback is not None:
+            self.gpio.remove_event_detect(self.gpio_in)
+            self.callback = None
+
+    def _on_edge(self, channel):
+
+        time_stamp = monotonic()
+        grip_state = 1 - self.gpio.input(self.gpio_in)
+
+        # Several edges can be detected for a single change
+        if grip_state != self.last_state and self.callback is not None:
+            self.last_state = grip_state
+            self.callback(grip_state, time_stamp)
+
+
+def grip_event(grip_state, time_stamp):
+
+    # Pushed message: grip state (1 char) followed by the time of the change in microseconds (15 chars)
+    return "{}{:015d}".format(grip_state, int(time_stamp * 10**6)).encode()
+
+
+class Connexion:
+
+    # Handle the messages of a client, in the binary format of 'protocol.py' or in the legacy format
+    # (commands padded with '*' to 5 characters); the format is recognized from the first byte of each message.
+    # Every method is called from the event loop of the server.
+
+    # A client that lets more than this amount of bytes pile up without reading them is considered dead
+    max_buffer_size = 64 * 1024
+
+    def __init__(self, server, reader, writer):
+
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+
+        self.peer = writer.get_extra_info("peername")
+
+        # Grip events are pushed to the client once it has subscribed, in the format of its subscription
+        self.subscribed = False
+        self.legacy = False
+
+    def send(self, data):
+
+        if self.writer.transport.is_closing():
+            return
 
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        self.writer.write(data)
 
-            s.bind((host, port))
-            s.listen(1)
-            while True:
+        if self.writer.transport.get_write_buffer_size() > self.max_buffer_size:
+            print("'{}' does not read its messages anymore: connexion closed.".format(self.peer))
+            self.writer.close()
 
-                print("Waiting for connection...")
-                conn, addr = s.accept()
+    def push_grip_event(self, grip_state, time_stamp):
 
-                with conn:
+        if self.legacy:
+            self.send(grip_event(grip_state, time_stamp))
+        else:
+            self.send(protocol.pack(protocol.GRIP_EVENT, 0, time_stamp, grip_state))
 
-                    print("Connected by '{}'.".format(addr))
-                    while True:
+    async def serve(self):
 
-                        try:
-                            data = conn.recv(5)  # Go signal
-                            if data:
-                                data = data.decode()
-                                if data[0] == "v":
-                                    aperture = int(data[1:].replace("*", ""))
-                                    valve.launch(aperture)
+        while True:
 
-                                elif data[0] == "g":
-                                    detector_state = grip.detect()
-                                    conn.send("{}".format(detector_state).encode())
+            first_byte = await self.reader.read(1)
+            if not first_byte:
+                print("No message.")
+                break
 
-                                elif data[0] == "s":
-                                    ttl_signal.send()
+            if first_byte[0] == protocol.VERSION:
+                data = first_byte + await self.reader.readexactly(protocol.FRAME.size - 1)
+                self.handle_message(protocol.unpack(data))
 
-                                else:
-                                    print("Message not understood: '{}'.".format(data))
-                            else:
-                                print("No message.")
-                                break
+            else:
+                data = first_byte + await self.reader.readexactly(4)
+                self.handle_legacy_message(data.decode())
 
-                        except Exception as e:
-                            print(e)
-                            break
+    def handle_message(self, message):
+
+        if message.opcode == protocol.GRIP_POLL:
+            time_stamp = monotonic()
+            self.send(protocol.pack(protocol.GRIP_POLL, message.seq, time_stamp, self.server.grip.detect()))
+
+        elif message.opcode == protocol.GRIP_SUBSCRIBE:
+            # Current state is sent as the reply, then changes are pushed as 'GRIP_EVENT'
+            time_stamp = monotonic()
+            self.send(protocol.pack(protocol.GRIP_SUBSCRIBE, message.seq, time_stamp, self.server.grip.detect()))
+            self.subscribed, self.legacy = True, False
+
+        elif message.opcode == protocol.VALVE:
+            # Reply is sent by the valve worker when the valve opens, with the open time actually granted
+            self.server.valve.launch(message.value, callback=lambda time_stamp, open_time: self.server.call_soon(
+                self.send, protocol.pack(protocol.VALVE, message.seq, time_stamp, open_time)))
+
+        elif message.opcode == protocol.TTL:
+            # Reply is sent by the TTL worker when the pin goes high
+            self.server.ttl_signal.send(callback=lambda time_stamp: self.server.call_soon(
+                self.send, protocol.pack(protocol.TTL, message.seq, time_stamp)))
+
+        elif message.opcode == protocol.CLOCK:
+            self.send(protocol.pack(protocol.CLOCK, message.seq, monotonic()))
+
+        else:
+            print("Message not understood: '{}'.".format(message))
+            self.send(protocol.pack(protocol.ERROR, message.seq, monotonic(), message.opcode))
+
+    def handle_legacy_message(self, data):
+
+        if data[0] == "v":
+            aperture = int(data[1:].replace("*", ""))
+            self.server.valve.launch(aperture)
+
+        elif data[0] == "g":
+            detector_state = self.server.grip.detect()
+            self.send("{}".format(detector_state).encode())
+
+        elif data[0] == "e":
+            # Subscription: grip changes are pushed to the client instead of being polled
+            self.send(grip_event(self.server.grip.detect(), monotonic()))
+            self.subscribed, self.legacy = True, True
+
+        elif data[0] == "s":
+            self.server.ttl_signal.send()
+
+        else:
+            print("Message not understood: '{}'.".format(data))
+
+
+class Server:
+
+    # Serve several clients at once (e.g. the task, a monitor and a logger) from a single asyncio event loop.
+    # Hardware is only driven from the loop (valve and TTL orders are then queued to their own workers), so
+    # that accesses are serialized without locks. Grip changes are detected once and sent to every subscriber.
+
+    connexion_class = Connexion
+
+    def __init__(self, grip, valve, ttl_signal, host='', port=1556):
+
+        self.grip = grip
+        self.valve = valve
+        self.ttl_signal = ttl_signal
+
+        self.host = host  # Empty string means all available interfaces
+        self.port = port
+
+        # Dead peers are detected by TCP keep-alive after 'keep_alive_idle' + 'keep_alive_interval' * 'keep_alive_count'
+        # seconds without answer
+        self.keep_alive_idle = 2
+        self.keep_alive_interval = 1
+        self.keep_alive_count = 3
+
+        self.connexions = set()
+        self.loop = None
+
+        # Set once the server listens, with the address it listens to (port 0: any free port)
+        self.ready = Event()
+        self.address = None
+
+    def call_soon(self, callback, *args):
+
+        # For callbacks coming from other threads (GPIO, valve worker)
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def on_grip_change(self, grip_state, time_stamp):
+
+        self.call_soon(self.broadcast, grip_state, time_stamp)
+
+    def broadcast(self, grip_state, time_stamp):
+
+        for connexion in list(self.connexions):
+            if connexion.subscribed:
+                connexion.push_grip_event(grip_state, time_stamp)
+
+    def set_keep_alive(self, sock):
+
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+        # Linux only
+        for option, value in (("TCP_KEEPIDLE", self.keep_alive_idle), ("TCP_KEEPINTVL", self.keep_alive_interval),
+                              ("TCP_KEEPCNT", self.keep_alive_count)):
+            if hasattr(socket, option):
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+    async def handle_client(self, reader, writer):
+
+        self.set_keep_alive(writer.get_extra_info("socket"))
+
+        connexion = self.connexion_class(server=self, reader=reader, writer=writer)
+        self.connexions.add(connexion)
+
+        print("Connected by '{}' ({} client(s)).".format(connexion.peer, len(self.connexions)))
+
+        try:
+            await connexion.serve()
+
+        except (asyncio.IncompleteReadError, ConnectionError, TimeoutError, ValueError) as e:
+            print(e)
+
+        finally:
+            self.connexions.discard(connexion)
+            writer.close()
+            print("Disconnected from '{}' ({} client(s)).".format(connexion.peer, len(self.connexions)))
+
+    def run(self):
+
+        # Event loop of its own, so that the server can also be run from another thread than the main one
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+        self.grip.subscribe(callback=self.on_grip_change)
+
+        server = self.loop.run_until_complete(asyncio.start_server(self.handle_client, self.host, self.port))
+        self.address = server.sockets[0].getsockname()[:2]
+        print("Waiting for connections on {}...".format(self.address))
+        self.ready.set()
+
+        try:
+            self.loop.run_forever()
+
+        finally:
+            self.grip.unsubscribe()
+            for connexion in list(self.connexions):
+                connexion.writer.close()
+            server.close()
+            self.loop.run_until_complete(server.wait_closed())
+            self.loop.close()
+
+    def stop(self):
+
+        # From any thread
+        self.call_soon(self.loop.stop)
+
+
+def main():
+
+    gpio = hardware.RaspberryGpio()
+
+    grip = Grip(gpio)
+    valve = Valve(hardware.SerialPort("/dev/ttyUSB0"))
+    ttl_signal = TtlSignal(gpio)
+
+    try:
+        Server(grip=grip, valve=valve, ttl_signal=ttl_signal).run()
 
     except (SystemExit, KeyboardInterrupt, Exception) as e:
         print("Got exception '{}' and will exit.".format(e))
 
+    finally:
+        grip.unsubscribe()
         valve.close()
         ttl_signal.close()
 
-        GPIO.cleanup()
+        gpio.cleanup()
 
 
 if __name__ == "__main__":
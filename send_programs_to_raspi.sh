@@ -2,6 +2,10 @@ rpi_ip_address=169.254.162.142
 
 scp raspi/raspi_manager.py pi@${rpi_ip_address}:/home/pi/raspi_manager.py
 
+scp raspi/protocol.py pi@${rpi_ip_address}:/home/pi/protocol.py
+
+scp raspi/hardware.py pi@${rpi_ip_address}:/home/pi/hardware.py
+
 scp raspi/raspi_manager.service pi@${rpi_ip_address}:/home/pi/raspi_manager.service
 
 scp raspi/test_services.sh pi@${rpi_ip_address}:/home/pi/test_service.sh
\ No newline at end of file
@@ -1,15 +1,16 @@
-from collections import OrderedDict
-from datetime import date
 from threading import Event, Thread
-import time
 import json
 from os import path
 import numpy as np
 
-from data_management.database import Database
+from data_management.journal import Journal
+from data_management.session_writer import SessionWriter
+from data_management.trial_record import TrialRecord
 from task.ressources import GripManager, ValveManager, TtlManager, \
-    GripTracker, Timer, Client, GaugeAnimation
+    GripTracker, Timer, Client, GaugeAnimation, Scheduler
 from task.stimuli_finder import StimuliFinder
+from task.transitions import ANY, State, TABLE
+from utils.tracing import Tracer
 from utils.utils import log
 
 
@@ -17,7 +18,9 @@ class Manager(Thread):
 
     name = "Manager"
 
-    def __init__(self, communicant, queues, shutdown):
+    def __init__(self, communicant, queues, shutdown, tracer=None, scheduler=None, database_path=None):
+
+        # 'communicant': None without graphic interface; 'scheduler': for using another clock (simulations)
 
         super().__init__()
 
@@ -25,9 +28,22 @@ class Manager(Thread):
         self.shutdown = shutdown
         self.communicant = communicant
 
+        # Latency of messages (disabled by default)
+        self.tracer = tracer if tracer is not None else Tracer()
+
+        # Message being handled (instructions for the interface continue its path)
+        self.message = None
+
+        # Single thread for timers, gauge animation and grip watch
+        self.scheduler = scheduler if scheduler is not None else Scheduler(grip_queue=self.queues["grip_queue"])
+
+        # Clock of the time stamps
+        self.clock = self.scheduler.now
+
         self.grip_tracker = GripTracker(
+            scheduler=self.scheduler,
             message_queue=self.queues["manager"],
-            change_queue=self.queues["grip_queue"]
+            tracer=self.tracer
         )
 
         # --------- PROCESS FOR GRIP AND VALVE --- #
@@ -41,7 +57,7 @@ class Manager(Thread):
 
         self.grip_manager = GripManager(
             grip_value=self.queues["grip_value"], grip_queue=self.queues["grip_queue"],
-            client=self.client)
+            client=self.client, mode=rpi_parameters.get("grip_mode", "push"), tracer=self.tracer)
 
         self.valve_manager = ValveManager(client=self.client)
         self.ttl_manager = TtlManager(client=self.client)
@@ -62,29 +78,42 @@ class Manager(Thread):
         self.gauge_level = 0
 
         self.stimuli_parameters = {}
-        self.to_save = []
         self.error = None
 
         self.dice_output = 0
 
-        self.current_saving = Event()
-        self.data_saved = Event()
+        self.journal = Journal(folder=Journal.default_folder(database_path))
+        self.session_writer = SessionWriter(database_path=database_path)
+
         self.waiting_event = Event()
 
         # -------- TIME & TIMERS ----------- #
 
-        self.timer = Timer(message_queue=self.queues["manager"])
-        self.gauge_animation = GaugeAnimation(message_queue=self.queues["manager"])
+        self.timer = Timer(scheduler=self.scheduler, message_queue=self.queues["manager"], tracer=self.tracer)
+        self.gauge_animation = GaugeAnimation(
+            scheduler=self.scheduler, message_queue=self.queues["manager"], tracer=self.tracer)
+
+        # Messages from these are ignored if they have been cancelled (or launched again) since they were sent
+        self.scheduled = {
+            "timer": self.timer,
+            "gauge_animation": self.gauge_animation,
+            "grip_tracker": self.grip_tracker
+        }
 
         self.time_reference = -1
 
+        # When the grip change that triggered the current step happened (as measured by the Raspberry Pi)
+        self.grip_event_time = None
+
         self.time_reaction = -1
         self.time_movement = -1
         self.time_back_movement = -1
         self.time_inter_trial = -1
         self.time_inter_block = -1
         self.time_fixation = -1
-        
+
+        self.actual_durations = {}
+
         self.time_stamp_grip_onset = -1 
         self.time_stamp_release_grip = -1
         self.time_stamp_cue_onset = -1
@@ -103,7 +132,15 @@ class Manager(Thread):
         self.n_block = 0
 
         # ------ STATE MANAGEMENT ---- #
-        self.state = ""
+        self.state = State.NONE
+
+        # (source, command) -> state -> (bound handler, if it takes the payload), from the table of transitions
+        self.dispatch = {
+            key: {state: (getattr(self, transition.handler) if transition.handler is not None else None,
+                          transition.with_payload)
+                  for state, transition in transitions.items()}
+            for key, transitions in TABLE.items()
+        }
 
         # ------ INIT ------ #
 
@@ -113,32 +150,42 @@ class Manager(Thread):
 
     def initialize(self):
 
-        self.grip_tracker.start()
-        self.timer.start()
-        self.gauge_animation.start()
+        self.scheduler.start()
+        self.session_writer.start()
 
     def run(self):
 
         log("Run.", self.name)
         while not self.shutdown.is_set():
             log("Waiting for a message.", self.name)
-            message = self.queues["manager"].get()
-            self.handle_message(message)
+            self.receive(self.queues["manager"].get())
 
         self.die()
 
+    def receive(self, message):
+
+        self.message = self.tracer.stamp(message, "manager")
+
+        if self.is_outdated(self.message):
+            log("Outdated message ignored: '{}'.".format(self.message), self.name)
+            return
+
+        self.handle_message(self.message)
+        self.tracer.finish(self.message)
+
     def die(self):
 
         log("End program.", self.name)
 
-        if self.current_saving.is_set():
+        # Session writer writes trials remaining in its queue before dying
+        if self.session_writer.current_saving.is_set():
             log("Wait for saving.", self.name)
-            self.data_saved.wait()
+        self.journal.end()
+        self.session_writer.end()
+        self.session_writer.join()
 
-        self.timer.end()
-        self.gauge_animation.end()
+        self.scheduler.end()
 
-        self.grip_tracker.end()
         self.grip_manager.end()
         self.valve_manager.end()
         self.ttl_manager.end()
@@ -149,237 +196,79 @@ class Manager(Thread):
 
     # ------------------------ HANDLE MESSAGE --------------------------- #
 
-    def handle_message(self, message):
-
-        if message[0] == "game":
-
-            command = message[1]
-
-            if command == "choice":
-
-                if self.state == "show_stimuli":
-                    self.did_not_release_grip_to_decide()
-
-                elif self.state == "release_grip_to_decide":
-
-                    self.ask_interface(("play_sound", "choice"))
+    def is_outdated(self, message):
 
-                    side = message[2]
+        # Messages of the scheduler end with the generation they were sent for
+        source = self.scheduled.get(message[0])
+        return source is not None and not source.is_current(message[-1])
 
-                    if side == "left":
-                        log("Choice left.", self.name)
-                        self.decide("left")
+    def handle_message(self, message):
 
-                    elif side == "right":
-                        log("Choice right.", self.name)
-                        self.decide("right")
+        # Only valid for the step triggered by the current message
+        self.grip_event_time = None
 
-                    else:
-                        log("I will raise an exception.", self.name)
-                        raise Exception
+        transitions = self.dispatch.get(message[:2])
+        if transitions is None:
+            log("ERROR: Message not understood: '{}'.".format(message), self.name)
+            raise Exception("{}: Received message '{}' but did'nt expected anything like that."
+                            .format(self.name, message))
 
-                else:
-                    log("Ignore click on target left because state is not 'show_stimuli'.", self.name)
+        transition = transitions.get(self.state) or transitions.get(ANY)
+        if transition is None:
+            log("Command '{}' ignored (not in the appropriate state)."
+                .format(message[1]), self.name)
+            return
 
-            elif command == "play":
-                log("Play.", self.name)
-                self.play_game()
+        handler, with_payload = transition
+        payload = self.unpack(message)
 
-            elif command == "close":
-                log("Close game window.", self.name)
-                self.end_game()
+        if handler is None:
+            log("Nothing to do for '{}'.".format(message[:2]), self.name)
+        elif with_payload:
+            handler(payload)
+        else:
+            handler()
 
-            else:
-                log("ERROR: Message received from GameWindow not understood: '{}'.".format(message), self.name)
-                raise Exception("{}: Received message '{}' but did'nt expected anything like that."
-                                .format(self.name, message))
+    def unpack(self, message):
 
-        elif message[0] == "grip_tracker":
+        # Return the payload of the message: (source, command, payload, ...)
+        source, command = message[:2]
 
-            command = message[1]
+        if source == "grip_tracker":
             log("Received from GripTracker: '{}'.".format(command), self.name)
+            self.grip_event_time = message[2]
+            return None
 
-            if command == "release_before_end_of_fixation_time":
-
-                if self.state == "grasp_before_stimuli_display":
-                    self.release_before_end_of_fixation_time()
-
-                else:
-                    log("Command '{}' ignored (not in the appropriate state)."
-                        .format(command), self.name)
-
-            elif command == "grasp_before_stimuli_display":
-
-                if self.state == "wait_for_grasping":
-                    self.grasp_before_stimuli_display()
-
-                else:
-                    log("Command '{}' ignored (not in the appropriate state)."
-                        .format(command), self.name)
-
-            elif command == "release_grip_to_decide":
-
-                if self.state == "show_stimuli":
-                    self.release_grip_to_decide()
-
-                else:
-                    log("Command '{}' ignored (not in the appropriate state)."
-                        .format(command), self.name)
-
-            elif command == "come_back_to_grip_instead_of_deciding":
-                if self.state == "release_grip_to_decide":
-                    self.come_back_to_grip_instead_of_deciding()
-
-                else:
-                    log("Command '{}' ignored (not in the appropriate state)."
-                        .format(command), self.name)
-
-            elif command == "show_results":
-
-                if self.state == "decide":
-                    self.show_results()
-
-                else:
-                    log("Command '{}' ignored (not in the appropriate state)."
-                        .format(command), self.name)
-
-            else:
-                log("ERROR: Message received from GripTracker not understood: '{}'.".format(message), self.name)
-                raise Exception("{}: Received message '{}' but did'nt expected anything like that."
-                                .format(self.name, message))
-
-        elif message[0] == "timer":
-
-            command, ts, = message[1:]
-            log("Received from Timer: '{}' with and ts '{}'.".format(command, ts), self.name)
-
-            if command == "begin_new_block":
-
-                if self.state == "end_block":
-                    self.begin_new_block()
-
-                else:
-                    log("Command '{}' ignored (not in the appropriate state)."
-                        .format(command), self.name)
-
-            elif command == "show_stimuli":
-
-                if self.state == "grasp_before_stimuli_display":
-                    self.show_stimuli()
-
-                else:
-                    log("Command '{}' ignored (not in the appropriate state)."
-                        .format(command), self.name)
-
-            elif command == "did_not_came_back_to_the_grip":
+        elif source == "timer":
+            log("Received from Timer: '{}' with and ts '{}'.".format(command, message[2]), self.name)
 
-                if self.state == "decide":
-                    self.did_not_came_back_to_the_grip()
+            # Actual duration of the epoch that ends (by state), to be compared with the requested one
+            self.actual_durations[self.state] = self.timer.elapsed()
+            return None
 
-                else:
-                    log("Command '{}' ignored (not in the appropriate state)."
-                        .format(command), self.name)
-
-            elif command == "did_not_take_decision":
-
-                if self.state in ["show_stimuli", "release_grip_to_decide"]:
-                    self.did_not_take_decision()
-
-                else:
-                    log("Command '{}' ignored (not in the appropriate state)."
-                        .format(command), self.name)
-
-            elif command == "inter_trial":
-
-                if self.state == "show_results":
-                    self.inter_trial()
-
-                else:
-                    log("Command '{}' ignored (not in the appropriate state)."
-                        .format(command), self.name)
-
-            elif command == "end_trial":
-
-                if self.state in ["inter_trial", "punishment"]:
-                    self.end_trial()
-
-                else:
-                    log("Command '{}' ignored (not in the appropriate state)."
-                        .format(command), self.name)
-
-            elif command == "inter_block":
-
-                if self.state == "reward":
-                    self.inter_block()
-
-                else:
-                    log("Command '{}' ignored (not in the appropriate state)."
-                        .format(command), self.name)
-
-            elif command == "end_block":
-
-                if self.state == "inter_block":
-                    self.end_block()
-
-                else:
-                    log("Command '{}' ignored (not in the appropriate state)."
-                        .format(command), self.name)
-
-            else:
-                log("ERROR: Message received from Timer not understood: '{}'.".format(message), self.name)
-                raise Exception("{}: Received message '{}' from Timer but did'nt expected anything like that."
-                                .format(self.name, message))
-
-        elif message[0] == "gauge_animation":
+        return message[2] if len(message) > 2 else None
 
-            if self.state in ["show_results", "reward"]:
+    def choose(self, side):
 
-                command, kwargs, = message[1:]
+        if side not in ("left", "right"):
+            log("I will raise an exception.", self.name)
+            raise Exception("{}: Choice '{}' not understood.".format(self.name, side))
 
-                if command == "set_gauge_quantity":
-                    self.set_gauge_quantity(**kwargs)
+        self.ask_interface(("play_sound", "choice"))
 
-                else:
-                    log("ERROR: Message received from GaugeAnimation not understood: '{}'.".format(message), self.name)
-                    raise Exception("{}: Received message '{}' from GaugeAnimation "
-                                    "but did'nt expected anything like that."
-                                    .format(self.name, message))
-
-            else:
-                log("Command '{}' ignored (not in the appropriate state)."
-                    .format("gauge_animation"), self.name)
-
-        elif message[0] == "interface":
+        log("Choice {}.".format(side), self.name)
+        self.decide(side)
 
-            command = message[1]
-            if command == "close_task":
-                log("Interface close task.", self.name)
-                self.end_game()
+    def set_gauge_quantity_from_animation(self, kwargs):
 
-            elif command == "close":
-                log("Interface close window.", self.name)
-                return
-
-            elif command == "run":
-
-                log("Interface run.", self.name)
-                parameters = message[2]
-                self.prepare_game(parameters=parameters)
-            else:
-                log("ERROR: Message received from Interface not understood.", self.name)
-                raise Exception("{}: Received message '{}' but did'nt expected anything like that."
-                                .format(self.name, message))
-
-        else:
-            log("ERROR: Message not understood: '{}'.".format(message), self.name)
-            raise Exception("{}: Received message '{}' but did'nt expected anything like that."
-                            .format(self.name, message))
+        self.set_gauge_quantity(**kwargs)
 
     def ask_interface(self, instruction):
 
         assert type(instruction) == tuple, "Instruction is not in the right type."
-        self.queues["interface"].put(instruction)
-        self.communicant.signal.emit()
+        self.queues["interface"].put(self.tracer.carry(self.message, instruction, "ask_interface"))
+        if self.communicant is not None:
+            self.communicant.signal.emit()
 
 
 # ------------------------------------ START AND END GAME ---------------------------------------------------------- #
@@ -405,11 +294,18 @@ class Manager(Thread):
             incongruent_proportion=self.parameters["incongruent_proportion"]
         )
 
+        # Stimuli of the first trials are drawn now rather than at the beginning of the first trial
+        self.stimuli_finder.generate(self.stimuli_finder.batch_size)
+
         # Ask interface to show pause screen and trial counter
         self.ask_interface(("prepare_game", ))
 
+        # Open a new session in the database (trials will be saved as they are completed)
+        if self.parameters["save"]:
+            journal = self.journal.open(self.parameters)
+            self.session_writer.new_session(self.parameters, journal=journal)
+
         # Reinitialize
-        self.to_save = []
         self.trial_counter = [0, 0]
         self.n_block = 0
 
@@ -441,7 +337,7 @@ class Manager(Thread):
         log("NEW STATE -> End game.", self.name)
 
         # Update state
-        self.state = "end_game"
+        self.state = State.END_GAME
 
         # Stop the grip tracker
         self.grip_tracker.cancel()
@@ -453,11 +349,14 @@ class Manager(Thread):
         # Update display on game window
         self.ask_interface(("prepare_next_run", ))
 
-        # Save the session (database)
+        # Close the session (database)
         if self.parameters and self.parameters["save"]:
 
             self.save_session()
 
+        if self.parameters:
+            self.tracer.dump(self.parameters["monkey"])
+
 # ------------------------------------ START AND END BLOCK ---------------------------------------------------------- #
 
     def begin_new_block(self):
@@ -465,12 +364,15 @@ class Manager(Thread):
         log("NEW STATE -> Start new block.", self.name)
 
         # Update state
-        self.state = "new_block"
+        self.state = State.NEW_BLOCK
 
         # Reinitialize
         self.n_trial_inside_block = 0
         self.time_stamp_inter_block_interval_onset = -1
         self.time_inter_block = -1
+        self.actual_durations.pop("inter_block", None)
+        self.actual_durations.pop("reward", None)
+        self.valve_manager.clear_time_stamps()
         self.gauge_level = self.parameters["initial_stock"]
 
         # Update display of game window
@@ -484,7 +386,7 @@ class Manager(Thread):
         log("NEW STATE -> Reward.", self.name)
 
         # Update state
-        self.state = "reward"
+        self.state = State.REWARD
 
         # After time for rewarding, launch new block
         reward_time = self.parameters["reward_time"] / 1000
@@ -511,7 +413,7 @@ class Manager(Thread):
         log("NEW STATE -> New trial.", self.name)
 
         # Update state
-        self.state = "new_trial"
+        self.state = State.NEW_TRIAL
 
         # Reinitialize
         self.error = None
@@ -520,6 +422,10 @@ class Manager(Thread):
         self.time_back_movement = -1
         self.time_inter_trial = -1
         self.time_fixation = -1
+        self.actual_durations.pop("grasp_before_stimuli_display", None)
+        self.actual_durations.pop("inter_trial", None)
+        self.actual_durations.pop("punishment", None)
+        self.actual_durations.pop("show_results", None)
 
         self.time_stamp_grip_onset = -1
         self.time_stamp_release_grip = -1
@@ -550,7 +456,8 @@ class Manager(Thread):
             self.n_trial_inside_block += 1  # Increment the number of made trials inside the same block
 
         # Update display on graphic interface
-        self.ask_interface(("set_trial_counter", self.trial_counter))
+        # Messages are not copied anymore between threads: send a snapshot of the counter
+        self.ask_interface(("set_trial_counter", tuple(self.trial_counter)))
 
         # If no error, continue
         if self.error is None:
@@ -576,7 +483,7 @@ class Manager(Thread):
         log("NEW STATE -> Wait for grasping.", self.name)
 
         # Update state
-        self.state = "wait_for_grasping"
+        self.state = State.WAIT_FOR_GRASPING
 
         already_hold = self.queues["grip_value"].value == 1
 
@@ -589,21 +496,27 @@ class Manager(Thread):
         else:
             self.grip_tracker.launch(msg="grasp_before_stimuli_display")
 
+    def pop_grip_event_time(self):
+
+        # Time of the grip change that led to the current step if any (grip already hold...), otherwise now
+        event_time, self.grip_event_time = self.grip_event_time, None
+        return event_time if event_time is not None else self.clock()
+
     def grasp_before_stimuli_display(self):
 
         log("NEW STATE -> Grasp before stimuli display.", self.name)
 
         # Update state
-        self.state = "grasp_before_stimuli_display"
+        self.state = State.GRASP_BEFORE_STIMULI_DISPLAY
 
         print("*********************** TTL GRASP *******************************")
 
         if self.n_block == 0 and self.n_trial_inside_block == 0:
-            self.time_reference = time.perf_counter()
+            self.time_reference = self.pop_grip_event_time()
             self.time_stamp_grip_onset = 0
 
         else:
-            self.time_stamp_grip_onset = time.perf_counter() - self.time_reference
+            self.time_stamp_grip_onset = self.pop_grip_event_time() - self.time_reference
 
         # Inform recording system
         self.ttl_manager.send_signal()
@@ -623,17 +536,17 @@ class Manager(Thread):
         log("NEW STATE -> Show stimuli.", self.name)
 
         # Update state
-        self.state = "show_stimuli"
+        self.state = State.SHOW_STIMULI
 
         # Stop grip tracker whose purpose was to rise an error if user has release the grip
         self.grip_tracker.cancel()
 
         print("*********************** TTL STIMULI *******************************")
 
-        self.time_stamp_cue_onset = time.perf_counter() - self.time_reference
+        self.time_stamp_cue_onset = self.clock() - self.time_reference
 
-        # Inform recording system
-        self.ttl_manager.send_signal()
+        # Inform recording system (when the signal is actually sent is saved with the trial)
+        self.ttl_manager.send_signal(label="cue_onset")
 
         # Update display on game window
         self.ask_interface(("show_stimuli", ))
@@ -648,13 +561,13 @@ class Manager(Thread):
     def release_grip_to_decide(self):
 
         # Update state
-        self.state = "release_grip_to_decide"
+        self.state = State.RELEASE_GRIP_TO_DECIDE
 
         log("NEW STATE -> Release grip to decide.", self.name)
 
         print("*********************** TTL RELEASE GRIP *******************************")
 
-        self.time_stamp_release_grip = time.perf_counter() - self.time_reference
+        self.time_stamp_release_grip = self.pop_grip_event_time() - self.time_reference
 
         # Inform recording system
         self.ttl_manager.send_signal()
@@ -668,7 +581,7 @@ class Manager(Thread):
         log("NEW STATE -> Decide.", self.name)
 
         # Update state
-        self.state = "decide"
+        self.state = State.DECIDE
 
         # Stop previous timer for which the purpose was to raise an error if user did'nt took a decision
         self.timer.cancel()
@@ -678,7 +591,7 @@ class Manager(Thread):
 
         print("*********************** TTL DECIDE *******************************")
 
-        self.time_stamp_cue_contact = time.perf_counter() - self.time_reference
+        self.time_stamp_cue_contact = self.clock() - self.time_reference
 
         # Inform recording system
         self.ttl_manager.send_signal()
@@ -704,7 +617,7 @@ class Manager(Thread):
         log("NEW STATE -> Show results.", self.name)
 
         # Update state
-        self.state = "show_results"
+        self.state = State.SHOW_RESULTS
 
         # Stop previous timer whose purpose was to raise an error if user didn't come back
         self.timer.cancel()
@@ -714,7 +627,7 @@ class Manager(Thread):
 
         print("*********************** TTL RESULTS *******************************")
 
-        self.time_stamp_result_period_onset = time.perf_counter() - self.time_reference
+        self.time_stamp_result_period_onset = self.pop_grip_event_time() - self.time_reference
 
         # Inform recording system
         self.ttl_manager.send_signal()
@@ -737,7 +650,7 @@ class Manager(Thread):
         log("NEW STATE -> Inter-trial.", self.name)
 
         # Update state
-        self.state = "inter_trial"
+        self.state = State.INTER_TRIAL
 
         # Update display on game window
         self.ask_interface(("show_gauge", ))
@@ -747,7 +660,7 @@ class Manager(Thread):
             # Inform recording system
             print("*********************** TTL INTERTRIAL *******************************")
 
-            self.time_stamp_inter_trial_interval_onset = time.perf_counter() - self.time_reference
+            self.time_stamp_inter_trial_interval_onset = self.clock() - self.time_reference
 
             self.ttl_manager.send_signal()
 
@@ -768,7 +681,7 @@ class Manager(Thread):
         log("NEW STATE -> Inter-block.", self.name)
 
         # Update state
-        self.state = "inter_block"
+        self.state = State.INTER_BLOCK
 
         # Update display on game window
         self.ask_interface(("show_gauge", ))
@@ -777,7 +690,7 @@ class Manager(Thread):
 
             print("*********************** TTL INTERBLOCK*******************************")
 
-            self.time_stamp_inter_block_interval_onset = time.perf_counter() - self.time_reference
+            self.time_stamp_inter_block_interval_onset = self.clock() - self.time_reference
 
             # Inform recording system
             self.ttl_manager.send_signal()
@@ -825,7 +738,7 @@ class Manager(Thread):
 
         print("*********************** TTL VENTING *******************************")
 
-        self.time_stamp_reward_period_onset = time.perf_counter() - self.time_reference
+        self.time_stamp_reward_period_onset = self.clock() - self.time_reference
 
         # Inform recording system
         self.ttl_manager.send_signal()
@@ -855,7 +768,7 @@ class Manager(Thread):
 
         if "water" in kwargs and kwargs["water"] is True:
             if not self.parameters["fake"]:
-                self.valve_manager.open(self.parameters["valve_opening_time"])
+                self.valve_manager.open(self.parameters["valve_opening_time"], label=("reward", self.n_block))
             else:
                 log("FakeValveManager: GIVE WATER.", self.name)
 
@@ -881,7 +794,7 @@ class Manager(Thread):
         log("NEW STATE -> Punishment.", self.name)
 
         # Update state
-        self.state = "punishment"
+        self.state = State.PUNISHMENT
 
         # Update display on game window
         self.ask_interface(("show_black_screen",))
@@ -939,110 +852,56 @@ class Manager(Thread):
 
     def save_trial(self):
 
-        to_save = \
-            {
-                "error": self.error,
-                "choice": self.choice,
-                "dice_output": self.dice_output,
-                "gauge_level": self.gauge_level,
-                "n_trial_inside_block": self.n_trial_inside_block - 1, # Saving function is called after increasing n
-                "n_block": self.n_block,
-                "time_reaction": int(self.time_reaction * 1000),
-                "time_movement": int(self.time_movement * 1000),
-                "time_back_movement": int(self.time_back_movement * 1000),
-                "time_inter_trial": int(self.time_inter_trial * 1000),
-                "time_inter_block": int(self.time_inter_block * 1000),
-                "time_fixation": int(self.time_fixation * 1000),
-                "time_stamp_grip_onset": int(self.time_stamp_grip_onset * 1000),
-                "time_stamp_release_grip": int(self.time_stamp_release_grip * 1000),
-                "time_stamp_cue_onset": int(self.time_stamp_cue_onset * 1000),
-                "time_stamp_cue_contact": int(self.time_stamp_cue_contact * 1000),
-                "time_stamp_result_period_onset": int(self.time_stamp_result_period_onset * 1000),
-                "time_stamp_reward_period_onset": int(self.time_stamp_reward_period_onset * 1000),
-                "time_stamp_inter_block_interval_onset": int(self.time_stamp_inter_block_interval_onset * 1000),
-                "time_stamp_inter_trial_interval_onset": int(self.time_stamp_inter_trial_interval_onset * 1000),
-            }
-        to_save.update(self.stimuli_parameters)
-        self.to_save.append(to_save)
-
-    def save_session(self):
-
-        # In case of trying to end program
-        self.data_saved.clear()
-        self.current_saving.set()
-
-        log("SAVE SESSION.", self.name)
-
-        self.parameters.pop("save")
-
-        if len(self.to_save) < 1:
-            log("No trials to save.", self.name)
-            self.current_saving.clear()
-            self.data_saved.set()
-            return
-
-        else:
-            log("{} trials to save.".format(len(self.to_save)), self.name)
-
-        database = Database()
-        summary_table_name = "summary"
-
-        # Verify if a summary table exists, otherwise, create it
-        if not database.table_exists(summary_table_name):
-
-            columns = OrderedDict()
-
-            # Add columns for date and name of session table
-            columns["date"] = str
-            columns["session_table"] = str
+        to_save = TrialRecord(
+            error=self.error,
+            choice=self.choice,
+            dice_output=self.dice_output,
+            gauge_level=self.gauge_level,
+            n_trial_inside_block=self.n_trial_inside_block - 1,  # Saving function is called after increasing n
+            n_block=self.n_block,
+            time_reaction=int(self.time_reaction * 1000),
+            time_movement=int(self.time_movement * 1000),
+            time_back_movement=int(self.time_back_movement * 1000),
+            time_inter_trial=int(self.time_inter_trial * 1000),
+            time_inter_block=int(self.time_inter_block * 1000),
+            time_fixation=int(self.time_fixation * 1000),
+            time_fixation_actual=self.actual_duration("grasp_before_stimuli_display"),
+            time_inter_trial_actual=self.actual_duration("inter_trial"),
+            time_inter_block_actual=self.actual_duration("inter_block"),
+            time_punishment_actual=self.actual_duration("punishment"),
+            time_reward_actual=self.actual_duration("reward"),
+            time_result_display_actual=self.actual_duration("show_results"),
+            timer_lateness_max=self.scheduler.pop_max_lateness() * 1000,
+            time_stamp_grip_onset=int(self.time_stamp_grip_onset * 1000),
+            time_stamp_release_grip=int(self.time_stamp_release_grip * 1000),
+            time_stamp_cue_onset=int(self.time_stamp_cue_onset * 1000),
+            time_stamp_cue_onset_ttl=self.raspi_time_stamp(self.ttl_manager.pop_time_stamp("cue_onset")),
+            time_stamp_valve_onset=self.raspi_time_stamp(
+                self.valve_manager.pop_time_stamp(("reward", self.n_block))),
+            time_stamp_cue_contact=int(self.time_stamp_cue_contact * 1000),
+            time_stamp_result_period_onset=int(self.time_stamp_result_period_onset * 1000),
+            time_stamp_reward_period_onset=int(self.time_stamp_reward_period_onset * 1000),
+            time_stamp_inter_block_interval_onset=int(self.time_stamp_inter_block_interval_onset * 1000),
+            time_stamp_inter_trial_interval_onset=int(self.time_stamp_inter_trial_interval_onset * 1000),
+            **self.stimuli_parameters
+        )
+        self.journal.append(to_save)
+        self.session_writer.write_trial(to_save)
 
-            # Add a column for every parameter in parameter dic
-            for key, value in sorted(self.parameters.items()):
-                columns[key] = type(value)
-            database.create_table(
-                table_name=summary_table_name,
-                columns=columns)
+    def raspi_time_stamp(self, time_stamp):
 
-            log("Summary table created.", self.name)
+        # Time of the Raspberry Pi (converted in local time) -> ms since the time reference, as the other time stamps
+        return int((time_stamp - self.time_reference if time_stamp is not None else -1) * 1000)
 
-        else:
-            log("Summary table already exists.", self.name)
-
-        # Create a session table
-        log("Create session table.", self.name)
-        monkey = self.parameters["monkey"]
-        session_table_name = "session_{}_{}".format(str(date.today()).replace("-", "_"), monkey)
-        if database.table_exists(table_name=session_table_name):
-
-            log("Session table with name {} already exists.".format(session_table_name), self.name)
-
-            idx = 2
-            session_table_name += "({})".format(idx)
-            while database.table_exists(table_name=session_table_name):
-                log("Session table with name {} already exists.".format(session_table_name), self.name)
-                session_table_name = session_table_name.replace("({})".format(idx), "({})".format(idx+1))
-                idx += 1
-
-        columns = OrderedDict()
-        for key, value in sorted(self.to_save[0].items()):
-            columns[key] = type(value)
-
-        database.create_table(
-            table_name=session_table_name,
-            columns=columns
-        )
+    def actual_duration(self, state):
 
-        log("Session table created with name {}.".format(session_table_name), self.name)
+        # In ms, -1 if the epoch did not happen
+        return self.actual_durations[state] * 1000 if state in self.actual_durations else -1
 
-        # Fill summary table
-        database.fill_table(summary_table_name, **self.parameters, date=str(date.today()),
-                            session_table=session_table_name)
-
-        # Fill session table
-        for i in range(len(self.to_save)):
-            database.fill_table(session_table_name, **self.to_save[i])
+    def save_session(self):
 
-        log("DATA SAVED.", self.name)
+        log("SAVE SESSION.", self.name)
 
-        self.current_saving.clear()
-        self.data_saved.set()
+        # Trials have already been sent to the session writer by 'save_trial': just close the session
+        self.journal.close()
+        self.session_writer.end_session()
@@ -1,9 +1,16 @@
-from multiprocessing import Queue
-from threading import Thread, Event
+from threading import Thread, Event, Lock
 from datetime import datetime as dt
+from collections import deque
+from itertools import count
+from queue import Empty
+from time import perf_counter, sleep
+import heapq
 import socket
 import errno
 
+from raspi import protocol
+from utils.channel import channel
+from utils.tracing import Tracer
 from utils.utils import log
 
 
@@ -12,14 +19,101 @@ from utils.utils import log
 # --------------------------------------------------------------------------------------------------------------- #
 
 
+class ClockSync(object):
+
+    name = "ClockSync"
+
+    # NTP-style estimation of the offset between the monotonic clock of the Raspberry Pi and 'time.perf_counter'
+    # of the task computer. An exchange gives the offset with an error of at most half its round trip: only the
+    # fastest exchange of each burst is kept, and the drift is the slope of the offsets kept over time.
+
+    def __init__(self, window=30, min_span=30):
+
+        # (local time, offset, round trip) of the last bursts
+        self.samples = deque(maxlen=window)
+
+        # Drift is estimated only when samples span at least 'min_span' seconds
+        self.min_span = min_span
+
+        # Pi time = local time + offset + drift * (local time - reference)
+        self.reference = None
+        self.offset = None
+        self.drift = 0.
+
+        self.lock = Lock()
+
+    def add_burst(self, exchanges):
+
+        # 'exchanges': (local time of sending, Pi time, local time of reception) for every exchange of the burst
+        sent, remote, received = min(exchanges, key=lambda exchange: exchange[2] - exchange[0])
+        local = (sent + received) / 2
+
+        with self.lock:
+            self.samples.append((local, remote - local, received - sent))
+            self.estimate()
+
+        return received - sent
+
+    def estimate(self):
+
+        n = len(self.samples)
+        times = [sample[0] for sample in self.samples]
+        offsets = [sample[1] for sample in self.samples]
+
+        mean_time = sum(times) / n
+        mean_offset = sum(offsets) / n
+
+        if n >= 3 and times[-1] - times[0] >= self.min_span:
+            drift = sum((t - mean_time) * (o - mean_offset) for t, o in zip(times, offsets)) / \
+                sum((t - mean_time) ** 2 for t in times)
+        else:
+            drift = 0.
+
+        self.reference, self.offset, self.drift = mean_time, mean_offset, drift
+
+    def is_synchronized(self):
+
+        return self.offset is not None
+
+    def to_local(self, remote_time):
+
+        # Return None as long as no exchange has been made
+        with self.lock:
+            if self.offset is None:
+                return None
+            return (remote_time - self.offset + self.drift * self.reference) / (1 + self.drift)
+
+
 class Client(object):
 
+    name = "Client"
+
+    # Messages are framed as described in 'raspi/protocol.py': requests from several threads are pipelined on the
+    # same connexion and every reply is given back to the thread that waits for it (by sequence number).
+
     def __init__(self, ip_address, port):
 
         self.server_address = (ip_address, port)
         self.socket = None
         self.connected = False
 
+        self.send_lock = Lock()
+        self.sequence = count(1)
+
+        # Sequence number -> [Event, reply, local time of reception] for requests waiting for their reply
+        self.pending = {}
+
+        # Called with (grip state, time stamp) for every grip event pushed by the Raspberry Pi
+        self.grip_callback = None
+
+        self.reader = None
+
+        # Time stamps of the Raspberry Pi are converted in 'time.perf_counter' time; offset is estimated at
+        # connexion, then every 'sync_period' seconds with bursts of 'sync_burst' exchanges
+        self.clock = ClockSync()
+        self.sync_period = 10
+        self.sync_burst = 8
+
     def establish_connection(self):
 
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -32,6 +126,12 @@ class Client(object):
             log("I'm connected.", "RaspiManager")
             self.socket = sock
             self.connected = True
+
+            self.reader = Thread(target=self.read, daemon=True)
+            self.reader.start()
+
+            self.synchronize()
+            Thread(target=self.keep_synchronized, daemon=True).start()
             return 1
 
         except socket.error as e:
@@ -40,17 +140,117 @@ class Client(object):
                 sock.close()
             return 0
 
-    def send(self, string):
+    def request(self, opcode, value=0, wait=False, timeout=1):
+
+        # Send a request; if 'wait', return its reply (None after 'timeout' seconds without reply)
+        return self.exchange(opcode, value=value, wait=wait, timeout=timeout)[0]
+
+    def exchange(self, opcode, value=0, wait=False, timeout=1):
+
+        # Return reply, local time of sending and local time of reception of the reply
+        seq = next(self.sequence)
+
+        if wait:
+            self.pending[seq] = [Event(), None, None]
+
+        with self.send_lock:
+            sent = perf_counter()
+            self.socket.sendall(protocol.pack(opcode, seq, value=value))
+
+        if not wait:
+            return None, sent, None
+
+        answered = self.pending[seq][0].wait(timeout)
+        _, reply, received = self.pending.pop(seq)
+
+        if not answered:
+            log("No reply to request {} (opcode {}).".format(seq, opcode), self.name)
+
+        return reply, sent, received
+
+    def synchronize(self):
+
+        exchanges = []
+        for i in range(self.sync_burst):
+            reply, sent, received = self.exchange(protocol.CLOCK, wait=True)
+            if reply is not None and reply.opcode == protocol.CLOCK:
+                exchanges.append((sent, reply.time_stamp, received))
+
+        if exchanges:
+            round_trip = self.clock.add_burst(exchanges)
+            log("Clock offset: {:.6f} s (round trip: {:.3f} ms, drift: {:.2e}).".format(
+                self.clock.offset, round_trip * 1000, self.clock.drift), self.name)
+        else:
+            log("Clock could not be synchronized.", self.name)
+
+    def keep_synchronized(self):
+
+        while self.connected:
+            Event().wait(self.sync_period)
+            if self.connected:
+                self.synchronize()
+
+    def to_local_time(self, remote_time):
+
+        # Convert a time stamp of the Raspberry Pi; None if clocks are not synchronized yet
+        return self.clock.to_local(remote_time)
+
+    def subscribe_grip(self, callback, timeout=1):
+
+        # Return the reply giving the current grip state (None if there is no reply). The state of the reply is
+        # given to 'callback' by the reader thread, before any grip event that follows it.
+        self.grip_callback = callback
+        return self.request(protocol.GRIP_SUBSCRIBE, wait=True, timeout=timeout)
+
+    def read(self):
 
-        self.socket.send('{:*<5}'.format(string).encode())
+        while True:
 
-    def recv(self):
+            try:
+                data = protocol.recv_exactly(self.socket, protocol.FRAME.size)
+            except OSError:
+                data = b""
 
-        return self.socket.recv(1).decode()
+            received = perf_counter()
+
+            if not data:
+                log("Connexion closed.", self.name)
+                break
+
+            try:
+                message = protocol.unpack(data)
+            except ValueError as e:
+                log("Frame ignored: {}.".format(e), self.name)
+                continue
+
+            if message.opcode in (protocol.GRIP_EVENT, protocol.GRIP_SUBSCRIBE):
+                if self.grip_callback is not None:
+                    self.grip_callback(message.value, message.time_stamp)
+
+            if message.opcode != protocol.GRIP_EVENT:
+                # Single lookup: the request may have timed out (and been removed) in the meantime
+                waiting = self.pending.get(message.seq)
+                if waiting is not None:
+                    waiting[1:] = message, received
+                    waiting[0].set()
+
+            if message.opcode == protocol.ERROR:
+                log("Request {} not understood by the Raspberry Pi.".format(message.seq), self.name)
+
+        self.connected = False
+
+        # Do not let anyone wait for a reply that will never come
+        for waiting in list(self.pending.values()):
+            waiting[0].set()
 
     def close(self):
 
-        self.socket.close()
+        if self.socket is not None:
+            try:
+                self.socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.socket.close()
 
     def is_connected(self):
 
@@ -70,29 +270,47 @@ class ValveManager(Thread):
 
         super().__init__()
 
-        self.valve_queue = Queue()
+        self.valve_queue = channel()
         self.shutdown = Event()
 
         self.client = client
 
+        # Label -> when the valve has been opened for the first time for an order with this label (according to the
+        # clock of the Raspberry Pi, in 'time.perf_counter' time), until it is popped. Pulses can go on after the
+        # label has been popped: labels should not be reused (e.g. include the block in the label).
+        self.time_stamps = {}
+
     def run(self):
 
         log("Running.", self.name)
 
         while not self.shutdown.is_set():
 
-            v = self.valve_queue.get()
+            order = self.valve_queue.get()
             if not self.shutdown.is_set():
 
-                self.client.send("v{:4d}".format(v))
+                v, label = order
+                reply = self.client.request(protocol.VALVE, value=v, wait=True)
+                if reply is not None and label is not None:
+                    self.time_stamps.setdefault(label, self.client.to_local_time(reply.time_stamp))
 
         self.client.close()
 
         log("DEAD.", self.name)
 
-    def open(self, time):
+    def open(self, time, label=None):
+
+        self.valve_queue.put((time, label))
+
+    def pop_time_stamp(self, label):
+
+        # None if unknown
+        return self.time_stamps.pop(label, None)
+
+    def clear_time_stamps(self):
 
-        self.valve_queue.put(time)
+        # Forget time stamps of late pulses
+        self.time_stamps.clear()
 
     def end(self):
 
@@ -115,19 +333,25 @@ class TtlManager(Thread):
 
         self.client = client
 
-        self.ttl_queue = Queue()
+        self.ttl_queue = channel()
         self.shutdown = Event()
 
+        # Label -> when the TTL signal with this label has been sent (according to the clock of the Raspberry Pi,
+        # in 'time.perf_counter' time), until it is popped
+        self.time_stamps = {}
+
     def run(self):
 
         log("Running.", self.name)
 
         while not self.shutdown.is_set():
 
-            self.ttl_queue.get()
+            label = self.ttl_queue.get()
             if not self.shutdown.is_set():
 
-                self.client.send("s")
+                reply = self.client.request(protocol.TTL, wait=True)
+                if reply is not None and label is not None:
+                    self.time_stamps[label] = self.client.to_local_time(reply.time_stamp)
 
         self.client.close()
 
@@ -138,9 +362,14 @@ class TtlManager(Thread):
         self.shutdown.set()
         self.ttl_queue.put(None)
 
-    def send_signal(self):
+    def send_signal(self, label=None):
+
+        self.ttl_queue.put(label)
 
-        self.ttl_queue.put(True)
+    def pop_time_stamp(self, label):
+
+        # None if unknown
+        return self.time_stamps.pop(label, None)
 
 
 # --------------------------------------------------------------------------------------------------------------- #
@@ -152,15 +381,23 @@ class GripManager(Thread):
 
     name = "GripManager"
 
-    def __init__(self, grip_value, grip_queue, client):
+    def __init__(self, grip_value, grip_queue, client, mode="push", tracer=None):
 
         super().__init__()
 
+        self.tracer = tracer if tracer is not None else Tracer()
+
         self.grip_value = grip_value
         self.grip_queue = grip_queue
 
         self.client = client
 
+        # 'push': the Raspberry Pi sends grip changes as they happen; 'poll': grip state is asked every 10 ms
+        self.mode = mode
+
+        # Time of the last grip change according to the clock of the Raspberry Pi (push mode only)
+        self.last_event_time = None
+
         self.track_signal = Event()
         self.shutdown = Event()
 
@@ -168,24 +405,62 @@ class GripManager(Thread):
 
         log("Running.", self.name)
 
-        while not self.shutdown.is_set():
+        if self.mode == "push" and self.subscribe():
+            log("Listen to grip events.", self.name)
+            self.shutdown.wait()
+        else:
+            self.poll()
+
+        self.client.close()
+
+        log("DEAD.", self.name)
+
+    def set_grip_value(self, response, time_stamp):
 
-            self.client.send("g")  # Go signal
-            response = self.client.recv()
-            if response:
+        # Changes are put in the grip queue with the time they happened ('time.perf_counter' time). The grip value
+        # is updated first: whoever reads the former value is sure that the change has not been queued yet.
+        response = int(response)
 
-                response = int(response)
+        if response != self.grip_value.value:
+            event_time = self.client.to_local_time(time_stamp)
+            if event_time is None:
+                event_time = perf_counter()
 
-                if response != self.grip_value.value:
-                    self.grip_queue.put(response)
+            self.grip_value.value = response
 
-                self.grip_value.value = response
+            change = self.tracer.start((response, event_time), "grip_event", time_stamp=event_time)
+            self.grip_queue.put(self.tracer.stamp(change, "grip_manager"))
+
+    def poll(self):
+
+        log("Poll grip state.", self.name)
+
+        while not self.shutdown.is_set():
+
+            reply = self.client.request(protocol.GRIP_POLL, wait=True)
+            if reply is not None:
+                self.set_grip_value(reply.value, reply.time_stamp)
 
             Event().wait(0.01)  # Precision of 10 ms for the grip
 
-        self.client.close()
+    def subscribe(self):
 
-        log("DEAD.", self.name)
+        # The Raspberry Pi answers a subscription with the current grip state; without answer, fall back to polling
+        reply = self.client.subscribe_grip(callback=self.handle_event)
+
+        if reply is None or reply.opcode != protocol.GRIP_SUBSCRIBE:
+            log("Subscription failed, fall back to polling.", self.name)
+            self.client.grip_callback = None
+            return 0
+
+        # Current state has already been applied by the reader thread (see 'Client.subscribe_grip')
+        return 1
+
+    def handle_event(self, grip_state, time_stamp):
+
+        # Called by the reader thread of the client
+        self.last_event_time = time_stamp
+        self.set_grip_value(grip_state, time_stamp)
 
     def end(self):
 
@@ -193,274 +468,335 @@ class GripManager(Thread):
 
 
 # --------------------------------------------------------------------------------------------------------------- #
-# ------------------------------------- GRIP TRACKER ------------------------------------------------------------ #
+# ------------------------------------- SCHEDULER --------------------------------------------------------------- #
 # --------------------------------------------------------------------------------------------------------------- #
 
 
-class GripTracker(Thread):
+class Scheduler(Thread):
 
-    name = "GripTracker"
+    name = "Scheduler"
+
+    # Single thread for every delayed action of the task: timers, ticks of the gauge animation and watch of the grip.
+    # Deadlines ('time.perf_counter' time) are kept in a heap. Between two deadlines, the thread waits for grip
+    # changes on the grip queue; a 'None' put in the grip queue wakes it up (new earliest deadline, end).
+    # Nothing is removed from the heap when cancelled: callbacks check the generation they were scheduled for.
+    # The thread sleeps until 'spin' seconds before a deadline, then spins until the deadline (0: no spinning), so
+    # that durations do not depend on the wake-up latency of the OS.
 
-    def __init__(self, change_queue, message_queue):
+    def __init__(self, grip_queue, spin=0.001):
 
         super().__init__()
-        self.go_queue = Queue()
-        self.change_queue = change_queue
-        self.message_queue = message_queue
-        self.cancel_signal = Event()
+
+        self.grip_queue = grip_queue
+        self.spin = spin
+
+        # Maximum delay (s) between a deadline and the call of its callback, since last asked
+        self.max_lateness = 0.
+
+        # (deadline, sequence number, callback, args)
+        self.heap = []
+        self.lock = Lock()
+        self.sequence = count()
+
+        # Called with every grip change (state, time of the change)
+        self.grip_listeners = []
+
         self.shutdown = Event()
-        self.waiting = Event()
-        self.cancelled = Event()
-        self.running = Event()
+
+    def call_at(self, deadline, callback, *args):
+
+        with self.lock:
+            heapq.heappush(self.heap, (deadline, next(self.sequence), callback, args))
+            earliest = self.heap[0][0] == deadline
+
+        if earliest:
+            self.wake()
+
+    def call_later(self, delay, callback, *args):
+
+        self.call_at(self.now() + delay, callback, *args)
+
+    @staticmethod
+    def now():
+
+        # Clock of the deadlines
+        return perf_counter()
+
+    def add_grip_listener(self, listener):
+
+        self.grip_listeners.append(listener)
+
+    def notify_grip(self, change):
+
+        for listener in self.grip_listeners:
+            listener(change)
+
+    def after_grip_queue(self, callback, *args):
+
+        # 'callback' is called by the scheduler thread once every grip change already in the grip queue has been
+        # given to the listeners (changes are handled in order of arrival, whatever the time they happened)
+        self.grip_queue.put(GripQueueMark(callback, args))
 
     def run(self):
 
+        log("Running.", self.name)
+
         while not self.shutdown.is_set():
 
-            log("Waiting order.", self.name)
-            msg = self.go_queue.get()
-            self.running.set()
+            with self.lock:
+                timeout = self.heap[0][0] - self.now() if self.heap else None
 
-            if not self.shutdown.is_set():
+            if timeout is None or timeout > self.spin:
 
-                log("If change in grip state, I will deliver message '{}'.".format(msg), self.name)
+                try:
+                    change = self.grip_queue.get(timeout=timeout - self.spin if timeout is not None else None)
+                except Empty:
+                    change = None
 
-                self.waiting.set()
-                args = self.change_queue.get()
-                self.waiting.clear()
+                if isinstance(change, GripQueueMark):
+                    change.callback(*change.args)
+                elif change is not None:
+                    self.notify_grip(change)
 
-                if not self.cancel_signal.is_set():
+            else:
+                self.spin_until(perf_counter() + timeout)
 
-                    log("Received event in change queue: '{}'.".format(args), self.name)
-                    self.message_queue.put(("grip_tracker", msg))
+            self.run_due()
 
-                else:
-                    log("Cancelled.", self.name)
-                    self.cancelled.set()
+        log("DEAD.", self.name)
 
-        log("I'm DEAD.", self.name)
+    @staticmethod
+    def spin_until(deadline):
 
-    def launch(self, msg):
+        while perf_counter() < deadline:
+            sleep(0)  # Let other threads run
 
-        while not self.change_queue.empty():
-            self.change_queue.get()
+    def run_due(self):
 
-        self.cancel_signal.clear()
-        self.go_queue.put(msg)
-        self.running.wait()
-        self.running.clear()
+        while True:
 
-    def cancel(self):
+            with self.lock:
+                now = self.now()
+                if not self.heap or self.heap[0][0] > now:
+                    break
+                deadline, _, callback, args = heapq.heappop(self.heap)
+                self.max_lateness = max(self.max_lateness, now - deadline)
 
-        log("CANCEL.", self.name)
+            callback(*args)
 
-        self.cancel_signal.set()
+    def pop_max_lateness(self):
 
-        if self.waiting.is_set():
-            self.change_queue.put(None)
-            self.cancelled.wait()
-            self.cancelled.clear()
-        else:
-            log("I was not running.", self.name)
+        with self.lock:
+            max_lateness, self.max_lateness = self.max_lateness, 0.
+        return max_lateness
+
+    def wake(self):
+
+        self.grip_queue.put(None)
 
     def end(self):
 
         log("END.", self.name)
         self.shutdown.set()
-        self.cancel_signal.set()
-        self.change_queue.put(None)
-        self.go_queue.put(None)
+        self.wake()
 
-    def is_cancelled(self):
 
-        return self.cancel_signal.is_set()
+class GripQueueMark(object):
 
+    # Put in the grip queue by 'Scheduler.after_grip_queue'
 
-# --------------------------------------------------------------------------------------------------------------- #
-# -------------------------------------------- TIMER ------------------------------------------------------------ #
-# --------------------------------------------------------------------------------------------------------------- #
+    __slots__ = ["callback", "args"]
 
+    def __init__(self, callback, args):
 
-class Timer(Thread):
+        self.callback = callback
+        self.args = args
 
-    name = "Timer"
 
-    def __init__(self, message_queue):
+class Scheduled(object):
 
-        super().__init__()
+    # Base for what is driven by the scheduler. Every 'launch' and every 'cancel' gives a new generation:
+    # what has been scheduled (or sent to the manager) for a former generation is outdated. Launch and cancel
+    # never wait for the scheduler thread.
 
-        self.message_queue = message_queue
+    name = "Scheduled"
+
+    def __init__(self, scheduler, message_queue, tracer=None):
 
-        self.go_queue = Queue()
+        self.scheduler = scheduler
+        self.message_queue = message_queue
+        self.tracer = tracer if tracer is not None else Tracer()
 
+        self.generation = 0
         self.cancel_signal = Event()
-        self.wait_signal = Event()
-        self.cancelled = Event()
-        self.shutdown = Event()
-        self.waiting = Event()
-        self.running = Event()
 
-        self.msg, self.ts = None, None
+    def new_generation(self):
 
-    def run(self):
+        self.generation += 1
+        return self.generation
 
-        while not self.shutdown.is_set():
+    def is_current(self, generation):
 
-            log("Waiting order.", self.name)
+        return generation == self.generation
 
-            msg, time = self.go_queue.get()
-            self.running.set()
+    def is_cancelled(self):
 
-            if not self.shutdown.is_set():
+        return self.cancel_signal.is_set()
 
-                log("ORDER message '{}' with ts '{}'.".format(msg, self.ts), self.name)
 
-                self.waiting.set()
-                self.wait_signal.wait(timeout=time)
-                self.waiting.clear()
+# --------------------------------------------------------------------------------------------------------------- #
+# ------------------------------------- GRIP TRACKER ------------------------------------------------------------ #
+# --------------------------------------------------------------------------------------------------------------- #
 
-                log("RELEASED WITH MESSAGE '{}' with ts '{}'.".format(msg, self.ts), self.name)
 
-                if not self.cancel_signal.is_set():
-                    log("RUN message '{}' with ts '{}'.".format(msg, self.ts), self.name)
-                    self.message_queue.put(("timer", msg, self.ts))
+class GripTracker(Scheduled):
 
-                else:
-                    log("CANCELLED message '{}' with ts '{}'.".format(msg, self.ts), self.name)
-                    self.cancelled.set()
+    name = "GripTracker"
 
-        log("I'm DEAD.", self.name)
+    def __init__(self, scheduler, message_queue, tracer=None):
 
-    def launch(self, msg, time, debug=None):
+        super().__init__(scheduler=scheduler, message_queue=message_queue, tracer=tracer)
 
-        ts = dt.utcnow()
-        self.msg, self.ts = msg, ts
+        # (message, generation, armed) while watching the grip, otherwise None. The watch is armed once the changes
+        # that were in the grip queue at launch have been handled: only changes that arrive after the launch are
+        # delivered (the grip queue used to be emptied at launch). The time of a change is not used: it is given by
+        # the clock of the Raspberry Pi, and a change that happened just before the launch can arrive after it.
+        self.watch = None
+        self.watch_lock = Lock()
 
-        log("LAUNCH with message '{}' and ts '{}' /// DEBUG: {}.".format(self.msg, self.ts, debug), self.name)
+        self.scheduler.add_grip_listener(self.on_grip_change)
+
+    def launch(self, msg):
+
+        log("If change in grip state, I will deliver message '{}'.".format(msg), self.name)
 
         self.cancel_signal.clear()
-        self.wait_signal.clear()
-        self.go_queue.put((msg, time))
-        self.running.wait()
-        self.running.clear()
+        with self.watch_lock:
+            generation = self.new_generation()
+            self.watch = (msg, generation, False)
 
-    def cancel(self, debug=None):
+        self.scheduler.after_grip_queue(self.arm, generation)
 
-        log("CANCEL with message '{}' and ts '{}' /// DEBUG: {}.".format(self.msg, self.ts, debug), self.name)
-        self.cancel_signal.set()
+    def arm(self, generation):
 
-        if self.waiting.is_set():
+        with self.watch_lock:
+            if self.watch is not None and self.is_current(generation):
+                self.watch = self.watch[:2] + (True, )
 
-            self.wait_signal.set()
-            self.cancelled.wait()
-            self.cancelled.clear()
+    def on_grip_change(self, change):
 
-    def end(self):
+        # Called by the scheduler thread with (grip state, time of the change)
+        with self.watch_lock:
 
-        log("END.", self.name)
-        self.shutdown.set()
-        self.cancel_signal.set()
-        self.wait_signal.set()
-        self.go_queue.put((None, None))
+            if self.watch is None or not self.watch[2]:
+                return
 
-    def is_cancelled(self):
+            msg, generation, armed = self.watch
+            self.watch = None
 
-        return self.cancel_signal.is_set()
+        log("Received event in change queue: '{}'.".format(change), self.name)
+        self.message_queue.put(self.tracer.carry(change, ("grip_tracker", msg, change[1], generation), "grip_tracker"))
 
+    def cancel(self):
 
-class GaugeAnimation(Thread):
+        log("CANCEL.", self.name)
 
-    name = "GaugeAnimation"
-    message = "set_gauge_quantity"
+        self.cancel_signal.set()
+        with self.watch_lock:
+            self.watch = None
+            self.new_generation()
 
-    def __init__(self, message_queue):
 
-        super().__init__()
+# --------------------------------------------------------------------------------------------------------------- #
+# -------------------------------------------- TIMER ------------------------------------------------------------ #
+# --------------------------------------------------------------------------------------------------------------- #
 
-        self.message_queue = message_queue
 
-        self.go_queue = Queue()
+class Timer(Scheduled):
 
-        self.cancel_signal = Event()
-        self.wait_signal = Event()
-        self.cancelled = Event()
-        self.shutdown = Event()
-        self.waiting = Event()
-        self.running = Event()
+    name = "Timer"
+
+    def __init__(self, scheduler, message_queue, tracer=None):
+
+        super().__init__(scheduler=scheduler, message_queue=message_queue, tracer=tracer)
 
         self.msg, self.ts = None, None
+        self.launch_time = None
 
-    def run(self):
+    def launch(self, msg, time, debug=None):
 
-        while not self.shutdown.is_set():
+        ts = dt.utcnow()
+        self.msg, self.ts = msg, ts
+        self.launch_time = self.scheduler.now()
 
-            log("Waiting order.", self.name)
+        log("LAUNCH with message '{}' and ts '{}' /// DEBUG: {}.".format(self.msg, self.ts, debug), self.name)
 
-            kwargs = self.go_queue.get()
-            self.running.set()
+        self.cancel_signal.clear()
+        self.scheduler.call_at(self.launch_time + time, self.expire, self.new_generation(), msg, ts)
 
-            if not self.shutdown.is_set():
+    def expire(self, generation, msg, ts):
 
-                # '+2' allows to have a short time before the beginning of the sequence and a short time at the end
-                time_per_unity = kwargs["total_time"] / (kwargs["maximum"] + 2)
-                log("Time per unity: {}, Total time: {}, Maximum x: {}".format(time_per_unity, kwargs["total_time"],
-                                                                kwargs["maximum"]), self.name)
+        if self.is_current(generation):
+            log("RUN message '{}' with ts '{}'.".format(msg, ts), self.name)
+            self.message_queue.put(self.tracer.start(("timer", msg, ts, generation), "timer"))
 
-                for i, j in enumerate(kwargs["sequence"]):
+    def elapsed(self):
 
-                    self.waiting.set()
-                    self.wait_signal.wait(timeout=time_per_unity)
-                    self.waiting.clear()
+        # Time since the last launch
+        return self.scheduler.now() - self.launch_time
 
-                    log("RELEASED.", self.name)
+    def cancel(self, debug=None):
 
-                    if not self.cancel_signal.is_set():
-                        log("RUN for the {}st/nd time.".format(i), self.name)
+        log("CANCEL with message '{}' and ts '{}' /// DEBUG: {}.".format(self.msg, self.ts, debug), self.name)
+
+        self.cancel_signal.set()
+        self.new_generation()
 
-                        kwargs = {
-                            "quantity": j,
-                            "sound": kwargs["sound"],
-                            "water": kwargs["water"]
-                        }
 
-                        self.message_queue.put(("gauge_animation", self.message, kwargs))
-                    else:
-                        break
+# --------------------------------------------------------------------------------------------------------------- #
+# -------------------------------------------- GAUGE ANIMATION -------------------------------------------------- #
+# --------------------------------------------------------------------------------------------------------------- #
 
-                log("CANCELLED / FINISHED.", self.name)
-                self.cancelled.set()
 
-        log("I'm DEAD.", self.name)
+class GaugeAnimation(Scheduled):
+
+    name = "GaugeAnimation"
+    message = "set_gauge_quantity"
 
     def launch(self, **kwargs):
 
         log("LAUNCH", self.name)
 
         self.cancel_signal.clear()
-        self.wait_signal.clear()
-        self.go_queue.put(kwargs)
-        self.running.wait()
-        self.running.clear()
+        generation = self.new_generation()
 
-    def cancel(self, debug=None):
+        # '+2' allows to have a short time before the beginning of the sequence and a short time at the end
+        time_per_unity = kwargs["total_time"] / (kwargs["maximum"] + 2)
+        log("Time per unity: {}, Total time: {}, Maximum x: {}".format(time_per_unity, kwargs["total_time"],
+                                                                        kwargs["maximum"]), self.name)
 
-        log("CANCEL with message '{}' and ts '{}' /// DEBUG: {}.".format(self.msg, self.ts, debug), self.name)
-        self.cancel_signal.set()
+        # Ticks are scheduled from the same origin, so that delays do not add up
+        start = self.scheduler.now()
+        for i, j in enumerate(kwargs["sequence"]):
 
-        if self.waiting.is_set():
+            tick = {
+                "quantity": j,
+                "sound": kwargs["sound"],
+                "water": kwargs["water"]
+            }
 
-            self.wait_signal.set()
-            self.cancelled.wait()
-            self.cancelled.clear()
+            self.scheduler.call_at(start + (i + 1) * time_per_unity, self.tick, generation, i, tick)
 
-    def end(self):
+    def tick(self, generation, i, kwargs):
 
-        log("END.", self.name)
-        self.shutdown.set()
-        self.cancel_signal.set()
-        self.wait_signal.set()
-        self.go_queue.put(None)
+        if self.is_current(generation):
+            log("RUN for the {}st/nd time.".format(i), self.name)
+            self.message_queue.put(self.tracer.start(("gauge_animation", self.message, kwargs, generation),
+                                                     "gauge_animation"))
 
-    def is_cancelled(self):
+    def cancel(self, debug=None):
+
+        log("CANCEL /// DEBUG: {}.".format(debug), self.name)
 
-        return self.cancel_signal.is_set()
\ No newline at end of file
+        self.cancel_signal.set()
+        self.new_generation()
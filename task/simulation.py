@@ -0,0 +1,262 @@
+from contextlib import redirect_stdout
+from multiprocessing import Value
+from os import path
+from threading import Event
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from task.experimentalist import Manager
+from task.ressources import Scheduler
+from task.transitions import State
+from utils.channel import channel
+from utils.utils import log
+
+
+class VirtualScheduler(Scheduler):
+
+    name = "VirtualScheduler"
+
+    # Same interface as the scheduler, but without thread: time is virtual and jumps to the next deadline
+    # when 'advance' is called. Grip changes are given with 'notify_grip'.
+
+    def __init__(self):
+
+        super().__init__(grip_queue=None, spin=0)
+        self.time = 0.
+
+    def now(self):
+
+        return self.time
+
+    def start(self):
+
+        # Nothing to run in a thread
+        pass
+
+    def wake(self):
+
+        pass
+
+    def after_grip_queue(self, callback, *args):
+
+        # Grip changes are given right away: nothing is waiting
+        callback(*args)
+
+    def advance(self):
+
+        # Run what is due at the next deadline; return False if nothing is scheduled
+        with self.lock:
+            if not self.heap:
+                return False
+            self.time = max(self.time, self.heap[0][0])
+
+        self.run_due()
+        return True
+
+
+class SimulatedSubject(object):
+
+    name = "SimulatedSubject"
+
+    # Synthetic subject: chooses with a softmax (inverse temperature 'beta') over the expected values of the two
+    # lotteries, and times its movements with log-normal distributions (medians in seconds, log-scale 'sigma').
+    # Errors (releasing during fixation, not deciding, not coming back to the grip) happen with given probabilities.
+
+    def __init__(self, beta=1., grasp_time=0.3, reaction_time=0.35, movement_time=0.25, back_time=0.5, sigma=0.3,
+                 p_early_release=0.02, p_no_decision=0.01, p_no_return=0.01, seed=None):
+
+        self.beta = beta
+
+        self.grasp_time = grasp_time
+        self.reaction_time = reaction_time
+        self.movement_time = movement_time
+        self.back_time = back_time
+        self.sigma = sigma
+
+        self.p_early_release = p_early_release
+        self.p_no_decision = p_no_decision
+        self.p_no_return = p_no_return
+
+        self.rng = np.random.RandomState(seed)
+
+        self.simulation = None
+
+        self.n_choices = 0
+        self.n_best_choices = 0
+
+    def attach(self, simulation):
+
+        self.simulation = simulation
+
+    def delay(self, median):
+
+        return median * np.exp(self.sigma * self.rng.randn())
+
+    @staticmethod
+    def expected_value(stimuli, side):
+
+        p = stimuli["{}_p".format(side)]
+        return p * stimuli["{}_x0".format(side)] + (1 - p) * stimuli["{}_x1".format(side)]
+
+    def choose(self, stimuli):
+
+        difference = self.expected_value(stimuli, "left") - self.expected_value(stimuli, "right")
+        p_left = 1 / (1 + np.exp(-self.beta * difference))
+
+        side = "left" if self.rng.random_sample() < p_left else "right"
+
+        self.n_choices += 1
+        self.n_best_choices += (side == "left") == (difference >= 0)
+
+        return side
+
+    def on_state(self, state, manager):
+
+        # Called when the manager enters a new state
+        simulation = self.simulation
+
+        if state == State.WAIT_FOR_GRASPING:
+            simulation.after(self.delay(self.grasp_time), simulation.grip, 1)
+
+        elif state == State.GRASP_BEFORE_STIMULI_DISPLAY:
+            if self.rng.random_sample() < self.p_early_release:
+                simulation.after(self.rng.uniform(0, manager.parameters["fixation_time"][0] / 1000),
+                                 simulation.grip, 0)
+
+        elif state == State.SHOW_STIMULI:
+            if self.rng.random_sample() >= self.p_no_decision:
+                reaction_time = self.delay(self.reaction_time)
+                simulation.after(reaction_time, simulation.grip, 0)
+                simulation.after(reaction_time + self.delay(self.movement_time),
+                                 simulation.click, self.choose(manager.stimuli_parameters))
+
+        elif state == State.DECIDE:
+            if self.rng.random_sample() >= self.p_no_return:
+                simulation.after(self.delay(self.back_time), simulation.grip, 1)
+
+
+class Simulation(object):
+
+    name = "Simulation"
+
+    # Run the manager without graphic interface nor Raspberry Pi, on a virtual clock, with a simulated subject.
+    # Messages of the manager are handled in this thread; time jumps to the next deadline when nothing else happens.
+
+    def __init__(self, subject, parameters=None, database_path=None):
+
+        parameters_folder = path.abspath("{}/../parameters".format(path.dirname(path.abspath(__file__))))
+        with open("{}/parameters.json".format(parameters_folder)) as file:
+            self.parameters = json.load(file)
+
+        self.parameters.update(parameters if parameters is not None else {})
+        self.parameters["fake"] = True
+
+        self.queues = {
+            "manager": channel(),
+            "interface": channel(),
+            "grip_queue": channel(),
+            "grip_value": Value('i', 0)
+        }
+
+        self.scheduler = VirtualScheduler()
+
+        self.manager = Manager(communicant=None, queues=self.queues, shutdown=Event(),
+                               scheduler=self.scheduler, database_path=database_path)
+
+        self.subject = subject
+        self.subject.attach(self)
+
+    # ------------------------------------- ACTIONS OF THE SUBJECT -------------------------------------------- #
+
+    def after(self, delay, action, *args):
+
+        self.scheduler.call_later(delay, action, *args)
+
+    def grip(self, grip_state):
+
+        if self.queues["grip_value"].value != grip_state:
+            self.queues["grip_value"].value = grip_state
+            self.scheduler.notify_grip((grip_state, self.scheduler.now()))
+
+    def click(self, side):
+
+        self.queues["manager"].put(("game", "choice", side))
+
+    # ------------------------------------- RUN --------------------------------------------------------------- #
+
+    def run(self, n_trials):
+
+        manager_queue = self.queues["manager"]
+        manager_queue.put(("interface", "run", self.parameters))
+        manager_queue.put(("game", "play"))
+
+        last = None
+
+        while self.manager.trial_counter[0] < n_trials:
+
+            while not manager_queue.empty():
+
+                self.manager.receive(manager_queue.get())
+
+                current = (self.manager.state, self.manager.trial_counter[0], self.manager.n_block)
+                if current != last:
+                    last = current
+                    self.subject.on_state(self.manager.state, self.manager)
+
+            # Nothing is displayed
+            while not self.queues["interface"].empty():
+                self.queues["interface"].get()
+
+            if manager_queue.empty() and not self.scheduler.advance():
+                raise Exception("{}: Nothing can happen anymore in state '{}'.".format(self.name, self.manager.state))
+
+        self.manager.receive(("game", "close"))
+        self.manager.die()
+
+        return self.scheduler.now()
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Run the task with a simulated subject, faster than real time.")
+    parser.add_argument("--trials", type=int, default=1000)
+    parser.add_argument("--database", help="Path of the database (trials are not saved if not given)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--beta", type=float, default=1.)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        np.random.seed(args.seed)
+
+    subject = SimulatedSubject(beta=args.beta, seed=args.seed)
+    simulation = Simulation(
+        subject=subject, parameters={"save": args.database is not None, "monkey": "Simulated"},
+        database_path=args.database)
+    simulation.manager.stimuli_finder.seed(args.seed)
+
+    start = time.perf_counter()
+
+    if args.verbose:
+        virtual_time = simulation.run(args.trials)
+    else:
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            virtual_time = simulation.run(args.trials)
+
+    duration = time.perf_counter() - start
+    trial_counter = simulation.manager.trial_counter
+
+    log("{} trials ({} without errors) in {:.1f} s, i.e. {:.0f} trials per minute; {:.1f} h of task.".format(
+        trial_counter[0], trial_counter[1], duration, trial_counter[0] / duration * 60, virtual_time / 3600),
+        Simulation.name)
+    log("Choices of the best expected value: {:.1f}%.".format(
+        100 * subject.n_best_choices / max(subject.n_choices, 1)), Simulation.name)
+
+
+if __name__ == "__main__":
+
+    main()
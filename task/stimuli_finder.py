@@ -6,7 +6,36 @@ class StimuliFinder(object):
 
     name = "SimulusFinder"
 
-    def __init__(self):
+    # Stimuli are drawn in advance by batches ('generate'), in a single vectorized pass: 'find' only reads the next
+    # trial of the schedule. A schedule is a structured array with one row per trial (see 'fields').
+
+    # Conditions, with the trials they give
+    conditions = [
+        "p fixed; x0 positive",
+        "x fixed; x0 positive",
+        "p fixed; x0 negative",
+        "x fixed; x0 negative",
+        "p fixed; x0 negative vs positive",
+        "congruent positive",
+        "congruent negative",
+        "incongruent positive",
+        "incongruent negative"
+    ]
+
+    fields = [
+        ("condition", "U32"),
+        ("swapped", bool),  # If the first lottery of the condition is shown on the right
+        ("left_p", float),
+        ("left_x0", int),
+        ("left_x1", int),
+        ("left_beginning_angle", int),
+        ("right_p", float),
+        ("right_x0", int),
+        ("right_x1", int),
+        ("right_beginning_angle", int)
+    ]
+
+    def __init__(self, seed=None, batch_size=1000):
 
         # Container for proportion of every type of trial
         self.proportion = dict()
@@ -32,31 +61,15 @@ class StimuliFinder(object):
 
         self.sides = ["left", "right"]
 
-        self.conditions = {
-            "control": {
-                "without_losses":
-                    [
-                        self.p_fixed_x0_positive,
-                        self.x_fixed_x0_positive
-
-                    ],
-                "with_losses":
-                    [
-                        self.p_fixed_x0_negative,
-                        self.x_fixed_x0_negative,
-                        self.p_fixed_x0_negative_vs_positive
-                    ]
-            },
-            "congruent": {
-
-                "without_losses": self.congruent_positive,
-                "with_losses": self.congruent_negative
-            },
-            "incongruent": {
-                "without_losses": self.incongruent_positive,
-                "with_losses": self.incongruent_negative
-            }
-        }
+        self.rng = np.random.RandomState(seed)
+
+        # Trials drawn in advance ('find' draws a new batch of 'batch_size' trials when all have been used)
+        self.batch_size = batch_size
+        self.schedule = None
+        self.index = 0
+
+        # Stimuli parameters of every trial of the schedule, ready to be given
+        self.trials = []
 
     def set_parameters(self, control_trials_proportion, with_losses_proportion, incongruent_proportion):
 
@@ -64,121 +77,117 @@ class StimuliFinder(object):
         self.proportion["with_losses"] = with_losses_proportion / 100
         self.proportion["incongruent"] = incongruent_proportion / 100
 
-    def find(self):
-
-        control = np.random.random() < self.proportion["control_trials"]
-        with_losses = np.random.random() < self.proportion["with_losses"]
-
-        if control:
-            if with_losses:
-                stimuli = np.random.choice(self.conditions["control"]["with_losses"], p=[0.6, 0.3, 0.1])()
-            else:
-                stimuli = np.random.choice(self.conditions["control"]["without_losses"])()
-
-        else:
-            incongruent = np.random.random() < self.proportion["incongruent"]
-
-            if incongruent:
-                relevant_conditions = self.conditions["incongruent"]
-            else:
-                relevant_conditions = self.conditions["congruent"]
-
-            if with_losses:
-                stimuli = relevant_conditions["with_losses"]()
-            else:
-                stimuli = relevant_conditions["without_losses"]()
-
-        return stimuli
-
-    def p_fixed_x0_positive(self):
-
-        log("p fixed; x0 positive.", self.name)
-
-        single_p = np.random.choice(self.possible_p)
-        x0 = np.random.choice(self.positive_x, size=2, replace=False)
-
-        return self.assign_values(p=[single_p, single_p], x0=x0, x1=[0, 0])
-
-    def p_fixed_x0_negative(self):
-
-        log("p fixed; x0 negative.", self.name)
+        # Trials already drawn followed the former proportions
+        self.schedule = None
 
-        single_p = np.random.choice(self.possible_p)
-        x0 = np.random.choice(self.negative_x, size=2, replace=False)
+    def seed(self, seed):
 
-        return self.assign_values(p=[single_p, single_p], x0=x0, x1=[0, 0])
+        self.rng = np.random.RandomState(seed)
+        self.schedule = None
 
-    def p_fixed_x0_negative_vs_positive(self):
-
-        log("p fixed; x0 negative vs positive.", self.name)
+    def find(self):
 
-        single_p = np.random.choice(self.possible_p)
-        x0 = [np.random.choice(self.negative_x), np.random.choice(self.positive_x)]
+        if self.schedule is None or self.index >= len(self.schedule):
+            self.generate(self.batch_size)
 
-        return self.assign_values(p=[single_p, single_p], x0=x0, x1=[0, 0])
+        self.stimuli_parameters = self.trials[self.index]
+        self.index += 1
 
-    def x_fixed(self):
-
-        log("x fixed.", self.name)
+        return self.stimuli_parameters
 
-        p = np.random.choice(self.possible_p, size=2, replace=False)
-        single_x0 = np.random.choice(list(self.positive_x) + list(self.negative_x))
+    # ------------------------------------------------ SCHEDULE ------------------------------------------------ #
 
-        return self.assign_values(p=p, x0=[single_x0, single_x0], x1=[0, 0])
+    def generate(self, n):
 
-    def x_fixed_x0_positive(self):
+        # Draw 'n' trials; they will be given by the next calls to 'find'
+        rng = self.rng
 
-        log("x fixed; x0 positive.", self.name)
+        control = rng.random_sample(n) < self.proportion["control_trials"]
+        with_losses = rng.random_sample(n) < self.proportion["with_losses"]
+        incongruent = rng.random_sample(n) < self.proportion["incongruent"]
 
-        p = np.random.choice(self.possible_p, size=2, replace=False)
-        single_x0 = np.random.choice(self.positive_x)
+        # Index in 'conditions'
+        condition = np.zeros(n, dtype=int)
 
-        return self.assign_values(p=p, x0=[single_x0, single_x0], x1=[0, 0])
+        without_losses = control * ~with_losses
+        condition[without_losses] = rng.randint(2, size=np.sum(without_losses))
 
-    def x_fixed_x0_negative(self):
+        control_with_losses = control * with_losses
+        condition[control_with_losses] = 2 + rng.choice(3, size=np.sum(control_with_losses), p=[0.6, 0.3, 0.1])
 
-        log("x fixed; x0 negative.", self.name)
+        condition[~control] = 5 + 2 * incongruent[~control] + with_losses[~control]
 
-        p = np.random.choice(self.possible_p, size=2, replace=False)
-        single_x0 = np.random.choice(self.negative_x)
+        # Values of both lotteries (before they are assigned to a side) for every possible condition
+        single_p = rng.choice(self.possible_p, size=n)
+        two_p = self.draw_distinct(self.possible_p, n)
 
-        return self.assign_values(p=p, x0=[single_x0, single_x0], x1=[0, 0])
+        two_positive_x = self.draw_distinct(self.positive_x, n)
+        two_negative_x = self.draw_distinct(self.negative_x, n)
+        single_positive_x = rng.choice(self.positive_x, size=n)
+        single_negative_x = rng.choice(self.negative_x, size=n)
 
-    def congruent_positive(self):
+        sorted_p = np.sort(two_p, axis=1)
+        ascending_positive_x = np.sort(two_positive_x, axis=1)
+        ascending_negative_x = np.sort(two_negative_x, axis=1)
 
-        log("congruent positive.", self.name)
+        choices = [
+            (np.column_stack([single_p, single_p]), two_positive_x),
+            (two_p, np.column_stack([single_positive_x, single_positive_x])),
+            (np.column_stack([single_p, single_p]), two_negative_x),
+            (two_p, np.column_stack([single_negative_x, single_negative_x])),
+            (np.column_stack([single_p, single_p]), np.column_stack([single_negative_x, single_positive_x])),
+            (sorted_p, ascending_positive_x),
+            (sorted_p, ascending_negative_x[:, ::-1]),
+            (sorted_p, ascending_positive_x[:, ::-1]),
+            (sorted_p, ascending_negative_x)
+        ]
 
-        p = sorted(np.random.choice(self.possible_p, size=2, replace=False))
-        x0 = sorted(np.random.choice(self.positive_x, size=2, replace=False))
+        p = np.zeros((n, 2))
+        x0 = np.zeros((n, 2), dtype=int)
+        for i, (p_choice, x0_choice) in enumerate(choices):
+            relevant = condition == i
+            p[relevant] = p_choice[relevant]
+            x0[relevant] = x0_choice[relevant]
 
-        return self.assign_values(p=p, x0=x0, x1=[0, 0])
+        # Random side for the lotteries, random angle for every pie chart
+        swapped = rng.random_sample(n) < 0.5
+        side = np.column_stack([swapped, ~swapped]).astype(int)
+        rows = np.arange(n)[:, None]
 
-    def congruent_negative(self):
+        schedule = np.zeros(n, dtype=self.fields)
+        schedule["condition"] = np.asarray(self.conditions)[condition]
+        schedule["swapped"] = swapped
 
-        log("congruent negative.", self.name)
+        for i, name in enumerate(self.sides):
+            schedule["{}_p".format(name)] = p[rows, side][:, i]
+            schedule["{}_x0".format(name)] = x0[rows, side][:, i]
+            schedule["{}_beginning_angle".format(name)] = rng.randint(0, 360, size=n)
 
-        p = sorted(np.random.choice(self.possible_p, size=2, replace=False))
-        x0 = sorted(np.random.choice(self.negative_x, size=2, replace=False), reverse=True)
+        self.schedule = schedule
+        self.index = 0
 
-        return self.assign_values(p=p, x0=x0, x1=[0, 0])
+        names = list(self.stimuli_parameters.keys())
+        self.trials = [dict(zip(names, values)) for values in schedule[names].tolist()]
 
-    def incongruent_positive(self):
+        log("{} trials drawn in advance.".format(n), self.name)
 
-        log("incongruent positive.", self.name)
+        return schedule
 
-        p = sorted(np.random.choice(self.possible_p, size=2, replace=False))
-        x0 = sorted(np.random.choice(self.positive_x, size=2, replace=False), reverse=True)
+    def draw_distinct(self, values, n):
 
-        return self.assign_values(p=p, x0=x0, x1=[0, 0])
+        # 'n' pairs of different values
+        values = np.asarray(values)
+        idx = np.argsort(self.rng.random_sample((n, len(values))), axis=1)[:, :2]
+        return values[idx]
 
-    def incongruent_negative(self):
+    def x_fixed(self):
 
-        log("incongruent negative.", self.name)
+        log("x fixed.", self.name)
 
-        p = sorted(np.random.choice(self.possible_p, size=2, replace=False))
-        x0 = sorted(np.random.choice(self.negative_x, size=2, replace=False))
+        p = np.random.choice(self.possible_p, size=2, replace=False)
+        single_x0 = np.random.choice(list(self.positive_x) + list(self.negative_x))
 
-        return self.assign_values(p=p, x0=x0, x1=[0, 0])
+        return self.assign_values(p=p, x0=[single_x0, single_x0], x1=[0, 0])
 
     def random(self):
 
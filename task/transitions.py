@@ -0,0 +1,142 @@
+from collections import namedtuple, defaultdict
+import sys
+
+"""
+Transitions of the task: which handler of the manager is called for a message (source, command) in a given state.
+Messages are (source, command, ...); a message received in a state that is not listed for it is ignored.
+"""
+
+
+class State(object):
+
+    # States of the manager (interned strings, so that they are compared by identity first)
+
+    NONE = sys.intern("")
+    END_GAME = sys.intern("end_game")
+    NEW_BLOCK = sys.intern("new_block")
+    END_BLOCK = sys.intern("end_block")
+    REWARD = sys.intern("reward")
+    NEW_TRIAL = sys.intern("new_trial")
+    WAIT_FOR_GRASPING = sys.intern("wait_for_grasping")
+    GRASP_BEFORE_STIMULI_DISPLAY = sys.intern("grasp_before_stimuli_display")
+    SHOW_STIMULI = sys.intern("show_stimuli")
+    RELEASE_GRIP_TO_DECIDE = sys.intern("release_grip_to_decide")
+    DECIDE = sys.intern("decide")
+    SHOW_RESULTS = sys.intern("show_results")
+    INTER_TRIAL = sys.intern("inter_trial")
+    INTER_BLOCK = sys.intern("inter_block")
+    PUNISHMENT = sys.intern("punishment")
+
+
+# For messages handled whatever the state
+ANY = None
+
+# 'handler': name of a method of the manager (None: nothing to do); 'with_payload': if the handler takes the payload
+# of the message (see 'Manager.unpack')
+Transition = namedtuple("Transition", ["source", "command", "states", "handler", "with_payload"])
+
+TRANSITIONS = [
+
+    # ------------------ GAME WINDOW ------------------ #
+    Transition("game", "choice", {State.SHOW_STIMULI}, "did_not_release_grip_to_decide", False),
+    Transition("game", "choice", {State.RELEASE_GRIP_TO_DECIDE}, "choose", True),
+    Transition("game", "play", ANY, "play_game", False),
+    Transition("game", "close", ANY, "end_game", False),
+
+    # ------------------ GRIP TRACKER ----------------- #
+    Transition("grip_tracker", "release_before_end_of_fixation_time", {State.GRASP_BEFORE_STIMULI_DISPLAY},
+               "release_before_end_of_fixation_time", False),
+    Transition("grip_tracker", "grasp_before_stimuli_display", {State.WAIT_FOR_GRASPING},
+               "grasp_before_stimuli_display", False),
+    Transition("grip_tracker", "release_grip_to_decide", {State.SHOW_STIMULI}, "release_grip_to_decide", False),
+    Transition("grip_tracker", "come_back_to_grip_instead_of_deciding", {State.RELEASE_GRIP_TO_DECIDE},
+               "come_back_to_grip_instead_of_deciding", False),
+    Transition("grip_tracker", "show_results", {State.DECIDE}, "show_results", False),
+
+    # ------------------ TIMER ------------------------ #
+    Transition("timer", "begin_new_block", {State.END_BLOCK}, "begin_new_block", False),
+    Transition("timer", "show_stimuli", {State.GRASP_BEFORE_STIMULI_DISPLAY}, "show_stimuli", False),
+    Transition("timer", "did_not_came_back_to_the_grip", {State.DECIDE}, "did_not_came_back_to_the_grip", False),
+    Transition("timer", "did_not_take_decision", {State.SHOW_STIMULI, State.RELEASE_GRIP_TO_DECIDE},
+               "did_not_take_decision", False),
+    Transition("timer", "inter_trial", {State.SHOW_RESULTS}, "inter_trial", False),
+    Transition("timer", "end_trial", {State.INTER_TRIAL, State.PUNISHMENT}, "end_trial", False),
+    Transition("timer", "inter_block", {State.REWARD}, "inter_block", False),
+    Transition("timer", "end_block", {State.INTER_BLOCK}, "end_block", False),
+
+    # ------------------ GAUGE ANIMATION -------------- #
+    Transition("gauge_animation", "set_gauge_quantity", {State.SHOW_RESULTS, State.REWARD},
+               "set_gauge_quantity_from_animation", True),
+
+    # ------------------ INTERFACE -------------------- #
+    Transition("interface", "close_task", ANY, "end_game", False),
+    Transition("interface", "close", ANY, None, False),
+    Transition("interface", "run", ANY, "prepare_game", True),
+]
+
+
+def build(transitions):
+
+    # (source, command) -> state (or ANY) -> transition
+    table = defaultdict(dict)
+
+    for transition in transitions:
+
+        key = transition.source, transition.command
+        states = [ANY] if transition.states is ANY else transition.states
+
+        for state in states:
+            assert state not in table[key], "Two transitions for {} in state '{}'.".format(key, state)
+            table[key][state] = transition
+
+    return dict(table)
+
+
+TABLE = build(TRANSITIONS)
+
+
+def verify(manager_class):
+
+    # Return the list of the problems found in the table for this manager
+    problems = []
+
+    states = {value for name, value in vars(State).items() if name.isupper()}
+
+    for transition in TRANSITIONS:
+
+        if transition.handler is not None and not callable(getattr(manager_class, transition.handler, None)):
+            problems.append("No handler '{}' for {}.".format(transition.handler, transition[:2]))
+
+        if transition.states is not ANY:
+            for state in transition.states - states:
+                problems.append("Unknown state '{}' for {}.".format(state, transition[:2]))
+
+    return problems
+
+
+def export(file=sys.stdout):
+
+    # One line per (source, command, state), tab separated
+    print("source\tcommand\tstate\thandler", file=file)
+    for transition in TRANSITIONS:
+        states = ["*"] if transition.states is ANY else sorted(transition.states)
+        for state in states:
+            print("\t".join([transition.source, transition.command, state, str(transition.handler)]), file=file)
+
+
+def main():
+
+    from task.experimentalist import Manager
+
+    export()
+
+    problems = verify(Manager)
+    for problem in problems:
+        print(problem, file=sys.stderr)
+
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,60 @@
+from collections import deque
+from threading import Condition
+import multiprocessing
+import queue
+
+
+"""
+Queues for passing messages. Between threads of the same process, a message is passed as it is: no pickling,
+no feeder thread and no pipe (as with 'multiprocessing.Queue'). The multiprocessing transport is only used when
+the other end lives in another process.
+"""
+
+
+class Channel(object):
+
+    # Same interface as 'queue.Queue' for what is used here ('put', 'get', 'get_nowait', 'empty'), based on a deque
+    # (kept for Python < 3.7, where 'queue.SimpleQueue' does not exist)
+
+    def __init__(self):
+
+        self.items = deque()
+        self.not_empty = Condition()
+
+    def put(self, item):
+
+        with self.not_empty:
+            self.items.append(item)
+            self.not_empty.notify()
+
+    def get(self, block=True, timeout=None):
+
+        with self.not_empty:
+            if block and not self.not_empty.wait_for(lambda: self.items, timeout=timeout):
+                raise queue.Empty
+            if not self.items:
+                raise queue.Empty
+            return self.items.popleft()
+
+    def get_nowait(self):
+
+        return self.get(block=False)
+
+    def empty(self):
+
+        return not self.items
+
+    def qsize(self):
+
+        return len(self.items)
+
+
+def channel(across_processes=False):
+
+    if across_processes:
+        return multiprocessing.Queue()
+
+    if hasattr(queue, "SimpleQueue"):
+        return queue.SimpleQueue()
+
+    return Channel()
@@ -0,0 +1,146 @@
+from collections import defaultdict
+from datetime import datetime
+from os import path
+from threading import Lock
+from time import perf_counter
+import json
+import os
+
+import numpy as np
+
+from utils.utils import log
+
+
+class Traced(tuple):
+
+    # A message that carries the time stamps ('time.perf_counter') of the hops it went through.
+    # It is still a tuple, so that it is handled (and pickled through queues) as the original message.
+
+    def __new__(cls, message, hops=None):
+
+        obj = super().__new__(cls, message)
+        obj.hops = hops if hops is not None else []
+        obj.carried = False
+        return obj
+
+
+class Tracer(object):
+
+    name = "Tracer"
+
+    # Opt-in measure of the latency of every hop of a message, from its origin (grip change, timer, click...)
+    # to the screen: 'origin -> ... -> manager -> ask_interface -> interface -> screen'.
+    # Latencies (in ms) are gathered by stage ('hop -> next hop') and for the whole path ('origin => last hop'),
+    # then summarized in a file at the end of every session. When disabled, messages are left untouched.
+
+    # Upper edges (ms) of the bins of the histograms
+    bins = [0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, np.inf]
+
+    def __init__(self, enabled=False, folder=None):
+
+        self.enabled = enabled
+        self.folder = folder
+
+        self.latencies = defaultdict(list)
+        self.lock = Lock()
+
+    @classmethod
+    def from_parameters(cls):
+
+        parameters_folder = path.abspath("{}/../parameters".format(path.dirname(path.abspath(__file__))))
+        with open("{}/tracing.json".format(parameters_folder)) as file:
+            parameters = json.load(file)
+
+        return cls(enabled=parameters["enabled"], folder=path.expanduser(parameters["folder"]))
+
+    # ------------------------------------- STAMP -------------------------------------------------------------- #
+
+    def start(self, message, hop, time_stamp=None):
+
+        # 'time_stamp': when the event at the origin of the message happened, if known
+        if not self.enabled:
+            return message
+
+        return Traced(message, hops=[(hop, time_stamp if time_stamp is not None else perf_counter())])
+
+    def stamp(self, message, hop):
+
+        if isinstance(message, Traced):
+            self.add_hop(message.hops, hop)
+
+        return message
+
+    def carry(self, source, message, hop):
+
+        # 'message' is sent because of 'source': it continues its path
+        if not isinstance(source, Traced):
+            return message
+
+        source.carried = True
+
+        traced = Traced(message, hops=list(source.hops))
+        self.add_hop(traced.hops, hop)
+        return traced
+
+    def finish(self, message):
+
+        # End of the path, unless the message has been carried on by another one
+        if isinstance(message, Traced) and not message.carried and len(message.hops) > 1:
+            (origin, start), (last, end) = message.hops[0], message.hops[-1]
+            self.record("{} => {}".format(origin, last), end - start)
+
+    def add_hop(self, hops, hop):
+
+        now = perf_counter()
+        self.record("{} -> {}".format(hops[-1][0], hop), now - hops[-1][1])
+        hops.append((hop, now))
+
+    def record(self, stage, latency):
+
+        with self.lock:
+            self.latencies[stage].append(latency * 1000)
+
+    # ------------------------------------- SUMMARY ------------------------------------------------------------ #
+
+    def summary(self):
+
+        with self.lock:
+            latencies = {stage: np.asarray(values) for stage, values in self.latencies.items()}
+
+        summary = {}
+        for stage, values in sorted(latencies.items()):
+
+            counts = np.histogram(values, bins=[-np.inf] + self.bins)[0]
+            summary[stage] = {
+                "n": len(values),
+                "p50": float(np.percentile(values, 50)),
+                "p99": float(np.percentile(values, 99)),
+                "max": float(values.max()),
+                "histogram": {"<= {}".format(edge): int(count) for edge, count in zip(self.bins, counts)}
+            }
+
+        return summary
+
+    def dump(self, session_name):
+
+        # Write the summary of the session and begin a new one
+        if not self.enabled or not self.latencies:
+            return
+
+        summary = self.summary()
+
+        os.makedirs(self.folder, exist_ok=True)
+        file_path = path.join(self.folder, "latency_{}_{}.json".format(
+            datetime.now().strftime("%Y_%m_%d_%H_%M_%S"), session_name))
+
+        with open(file_path, "w") as file:
+            json.dump(summary, file, indent=4)
+
+        for stage, stats in summary.items():
+            log("{}: p50 {:.2f} ms, p99 {:.2f} ms, max {:.2f} ms (n={}).".format(
+                stage, stats["p50"], stats["p99"], stats["max"], stats["n"]), self.name)
+
+        with self.lock:
+            self.latencies.clear()
+
+        log("Latency summary written in '{}'.".format(file_path), self.name)